@@ -0,0 +1,19 @@
+import os
+import logging
+from functools import lru_cache
+from typing import Dict, Any
+import yaml
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "default_config.yaml")
+
+@lru_cache(maxsize=None)
+def load_config(path: str = None) -> Dict[str, Any]:
+    """Load the YAML config (AGENTBI_CONFIG overrides the default path), read once per process."""
+    path = path or os.getenv("AGENTBI_CONFIG", DEFAULT_CONFIG_PATH)
+    with open(path, "r") as f:
+        config = yaml.safe_load(f) or {}
+    logger.info(f"Loaded config from {path}")
+    return config
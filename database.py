@@ -0,0 +1,102 @@
+import os
+import asyncio
+import logging
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, Any
+from pymongo import MongoClient
+from pymongo.database import Database
+from config import load_config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Defaults for the `mongo` section of config/default_config.yaml
+MONGO_DEFAULTS = {
+    "max_pool_size": 50,
+    "min_pool_size": 0,
+    "max_idle_time_ms": 60_000,
+    "connect_timeout_ms": 5_000,
+    "server_selection_timeout_ms": 5_000,
+    "socket_timeout_ms": 30_000,
+    "w": 1,
+    "wtimeout_ms": 1_000,
+    "io_workers": 16
+}
+
+# One client per process; pymongo clients are thread-safe and pool their connections
+_client: Optional[MongoClient] = None
+# Bounded pool that async handlers hand blocking pymongo calls to (tasks run on
+# services.worker_pool's task pool)
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+def mongo_settings() -> dict:
+    """Connection settings from config; AGENTBI_MONGO_URI / AGENTBI_DB_NAME override the URI and database."""
+    config = load_config()
+    return {
+        "uri": os.getenv("AGENTBI_MONGO_URI", config.get("uri", "mongodb://localhost:27017")),
+        "db_name": os.getenv("AGENTBI_DB_NAME", config.get("db_name", "AgentBI-Demo")),
+        **MONGO_DEFAULTS,
+        **(config.get("mongo") or {})
+    }
+
+def get_client() -> MongoClient:
+    """The shared client, created on first use."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                settings = mongo_settings()
+                _client = MongoClient(
+                    settings["uri"],
+                    maxPoolSize=settings["max_pool_size"],
+                    minPoolSize=settings["min_pool_size"],
+                    maxIdleTimeMS=settings["max_idle_time_ms"],
+                    connectTimeoutMS=settings["connect_timeout_ms"],
+                    serverSelectionTimeoutMS=settings["server_selection_timeout_ms"],
+                    socketTimeoutMS=settings["socket_timeout_ms"],
+                    w=settings["w"],
+                    wTimeoutMS=settings["wtimeout_ms"]
+                )
+                logger.info(f"Opened MongoDB client (maxPoolSize={settings['max_pool_size']})")
+    return _client
+
+def get_db() -> Database:
+    """The configured database on the shared client; also the routers' FastAPI dependency."""
+    return get_client()[mongo_settings()["db_name"]]
+
+def close_client() -> None:
+    """Close the shared client and its pooled sockets; the next get_client() reopens it."""
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+            logger.info("Closed MongoDB client")
+
+def get_executor() -> ThreadPoolExecutor:
+    """The shared I/O thread pool, sized by mongo.io_workers (at most the connection pool size)."""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                settings = mongo_settings()
+                workers = min(settings["io_workers"], settings["max_pool_size"])
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agentbi-io")
+                logger.info(f"Started I/O thread pool with {workers} workers")
+    return _executor
+
+async def run_blocking(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking pymongo call on the I/O pool without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), partial(fn, *args, **kwargs))
+
+def shutdown_executor() -> None:
+    """Wait for running calls and stop the I/O pool; the next run_blocking() restarts it."""
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
@@ -1,16 +1,16 @@
 
 from typing import List, Dict, Any
 from datetime import datetime
-from pymongo import MongoClient
 import logging
+from database import get_db
+from services.threshold_rules import evaluate_thresholds
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def check_thresholds(segmentation_stats: List[Dict[str, Any]] = None, cash_flow_data: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+def check_thresholds(segmentation_stats: List[Dict[str, Any]] = None, cash_flow_data: List[Dict[str, Any]] = None, db=None) -> Dict[str, Any]:
     try:
-        client = MongoClient("mongodb://localhost:27017")
-        db = client["AgentBI-Demo"]
+        db = db if db is not None else get_db()
         logger.info(f"Checking thresholds with segmentation_stats: {len(segmentation_stats) if segmentation_stats else 0}, cash_flow_data: {len(cash_flow_data) if cash_flow_data else 0}")
         
         # Handle None inputs
@@ -21,29 +21,8 @@ def check_thresholds(segmentation_stats: List[Dict[str, Any]] = None, cash_flow_
             logger.warning("cash_flow_data is None, using empty list")
             cash_flow_data = []
         
-        triggers = []
-        # Threshold logic for segmentation_stats
-        for segment in segmentation_stats:
-            segment_id = segment.get("id", "unknown")
-            avg_order_value = segment.get("avgOrderValue", 0.0)
-            if avg_order_value > 1000:
-                triggers.append({
-                    "segment_id": segment_id,
-                    "trigger_type": "high_value_segment",
-                    "value": avg_order_value,
-                    "threshold": 1000
-                })
-        
-        # Threshold logic for cash_flow_data
-        for cash_flow in cash_flow_data:
-            revenue = cash_flow.get("sales", 0.0)  # Updated to match cashflow_engine.py output
-            if revenue < 5000:
-                triggers.append({
-                    "period": cash_flow.get("period", "unknown"),
-                    "trigger_type": "low_cash_flow",
-                    "value": revenue,
-                    "threshold": 5000
-                })
+        # Same declarative rules as services/threshold_engine
+        triggers = evaluate_thresholds(segmentation_stats, cash_flow_data, db=db)
         
         result = {
             "task_id": 7,
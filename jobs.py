@@ -0,0 +1,146 @@
+import os
+import uuid
+import logging
+import threading
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Optional
+from pymongo import ASCENDING
+from config import load_config
+from database import get_db
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOB_COLLECTION = "jobs"
+JOB_FINAL_STATUSES = ["succeeded", "failed", "cancelled"]
+DEFAULT_JOB_WORKERS = 2
+
+# Worker processes are spawned, not forked: a forked child would inherit the
+# parent's MongoClient and I/O threads, which pymongo does not support
+_pool: Optional[ProcessPoolExecutor] = None
+_futures: Dict[str, Future] = {}
+_lock = threading.Lock()
+
+def get_job_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                workers = (load_config().get("jobs") or {}).get("max_workers", DEFAULT_JOB_WORKERS)
+                _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+                logger.info(f"Started job pool with {workers} worker processes")
+    return _pool
+
+def _discard_pool(broken: ProcessPoolExecutor) -> None:
+    """Forget a pool whose worker died (crash, OOM kill); the next get_job_pool() starts a fresh one."""
+    global _pool
+    with _lock:
+        if _pool is not broken:
+            return
+        _pool = None
+    logger.warning("Job pool is broken, starting a new one for later jobs")
+    broken.shutdown(wait=False, cancel_futures=True)
+
+def shutdown_job_pool() -> None:
+    """Drop queued jobs and wait for running ones to finish."""
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    # Outside the lock: done callbacks of the finishing jobs take it
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _update_job(db, job_id: str, **fields) -> None:
+    db[JOB_COLLECTION].update_one({"job_id": job_id}, {"$set": fields})
+
+def _run_job(job_id: str, task_id: int, params: dict) -> str:
+    """Worker entry point: run one task with the worker's own client and record its outcome."""
+    from fastapi import HTTPException
+    from run_agent import execute_task
+    db = get_db()
+    job = db[JOB_COLLECTION].find_one({"job_id": job_id}) or {}
+    if job.get("cancel_requested"):
+        _update_job(db, job_id, status="cancelled", stage="cancelled", finished_at=datetime.now())
+        return "cancelled"
+    started_at = datetime.now()
+    _update_job(
+        db, job_id,
+        status="running", stage=f"running task {task_id}", progress=0.0,
+        started_at=started_at, worker_pid=os.getpid(),
+        queue_seconds=(started_at - job.get("created_at", started_at)).total_seconds()
+    )
+    try:
+        response = execute_task(task_id, params, db)
+        fields = {"status": "succeeded", "stage": "done", "progress": 1.0, "result": response["result"]}
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        fields = {"status": "failed", "stage": "failed", "error": detail}
+    # A cancel that arrived while the task ran wins over its outcome; the result is not attached
+    if (db[JOB_COLLECTION].find_one({"job_id": job_id}, {"cancel_requested": 1}) or {}).get("cancel_requested"):
+        fields = {"status": "cancelled", "stage": "cancelled"}
+    finished_at = datetime.now()
+    _update_job(db, job_id, **fields, finished_at=finished_at, run_seconds=(finished_at - started_at).total_seconds())
+    logger.info(f"Job {job_id} (task {task_id}) {fields['status']} in {(finished_at - started_at).total_seconds():.1f}s")
+    return fields["status"]
+
+def _on_done(job_id: str, future: Future, pool: ProcessPoolExecutor) -> None:
+    """Record outcomes the worker could not: jobs cancelled in the queue or lost with their worker."""
+    with _lock:
+        _futures.pop(job_id, None)
+    if future.cancelled():
+        _update_job(get_db(), job_id, status="cancelled", stage="cancelled", finished_at=datetime.now())
+    elif future.exception() is not None:
+        if isinstance(future.exception(), BrokenProcessPool):
+            _discard_pool(pool)
+        logger.error(f"Job {job_id} worker failed: {future.exception()}")
+        _update_job(get_db(), job_id, status="failed", stage="failed", error=str(future.exception()), finished_at=datetime.now())
+
+def submit_job(db, task_id: int, params: dict, pipeline_id: str = "AgentBI-Demo") -> Dict[str, Any]:
+    """Record a queued job and hand the task to the job pool. Returns the job document."""
+    db[JOB_COLLECTION].create_index([("job_id", ASCENDING)], unique=True)
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "task_id": task_id,
+        "pipeline_id": pipeline_id,
+        "status": "queued",
+        "stage": "queued",
+        "progress": 0.0,
+        "created_at": datetime.now()
+    }
+    db[JOB_COLLECTION].insert_one(dict(job))
+    pool = get_job_pool()
+    try:
+        future = pool.submit(_run_job, job["job_id"], task_id, params)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        pool = get_job_pool()
+        future = pool.submit(_run_job, job["job_id"], task_id, params)
+    with _lock:
+        _futures[job["job_id"]] = future
+    future.add_done_callback(lambda f, job_id=job["job_id"]: _on_done(job_id, f, pool))
+    logger.info(f"Queued task {task_id} as job {job['job_id']}")
+    return job
+
+def get_job(db, job_id: str) -> Optional[Dict[str, Any]]:
+    return db[JOB_COLLECTION].find_one({"job_id": job_id}, {"_id": 0})
+
+def cancel_job(db, job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Cancel a job. A queued job is removed from the pool at once; a running
+    job cannot be interrupted, so it is flagged cancel_requested and its
+    worker records it as cancelled, without the result, when the task
+    returns. Returns the updated job document.
+    """
+    job = get_job(db, job_id)
+    if job is None or job["status"] in JOB_FINAL_STATUSES:
+        return job
+    with _lock:
+        future = _futures.get(job_id)
+    if future is not None and future.cancel():
+        _update_job(db, job_id, status="cancelled", stage="cancelled", finished_at=datetime.now())
+    else:
+        _update_job(db, job_id, cancel_requested=True)
+    return get_job(db, job_id)
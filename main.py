@@ -1,6 +1,10 @@
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from run_agent import router
+from database import close_client, shutdown_executor
+from jobs import shutdown_job_pool
+from services.worker_pool import shutdown_worker_pool, shutdown_task_executor
 from dotenv import load_dotenv
 import warnings
 
@@ -10,7 +14,17 @@ load_dotenv()
 # Suppress urllib3 warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="urllib3")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The MongoDB client, thread pools and process pools open lazily on first use; close them on shutdown
+    yield
+    shutdown_job_pool()
+    shutdown_worker_pool()
+    shutdown_task_executor()
+    shutdown_executor()
+    close_client()
+
+app = FastAPI(lifespan=lifespan)
 
 # Include the router from run_agent.py
 app.include_router(router)
@@ -0,0 +1,131 @@
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, List
+from fastapi import HTTPException
+from services.worker_pool import run_compute
+from services.cashflow_engine import CASH_FLOW_GRANULARITIES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Task -> tasks whose results it consumes. Cash flow (2) and segmentation (3)
+# are independent; pricing (5) needs the segments; triggers (7) need segments
+# and cash flow; notifications (9) need the triggers; emails (10) need the
+# segments and the pricing.
+PIPELINE_DEPENDENCIES = {
+    2: [],
+    3: [],
+    5: [3],
+    7: [2, 3],
+    9: [7],
+    10: [3, 5]
+}
+# Preferred cash flow granularity for triggers, same order as task 7's lookup
+TRIGGER_GRANULARITIES = ["monthly", "weekly", "quarterly", "yearly"]
+
+def _stage_params(task_id: int, params: dict, results: Dict[int, dict], outputs: Dict[int, dict]) -> dict:
+    """Hand upstream results to a stage in memory; stages without them fall back to their own lookups."""
+    params = dict(params)
+    segmentation = results.get(3)
+    if task_id == 5 and segmentation:
+        params.setdefault("segmentation_stats", segmentation.get("stats", []))
+    elif task_id == 7:
+        if segmentation:
+            params.setdefault("segmentation_stats", segmentation.get("stats", []))
+        cash_flow = outputs.get(2, {}).get("cash_flow") or {}
+        for gran in TRIGGER_GRANULARITIES:
+            gran_key = CASH_FLOW_GRANULARITIES[gran]["key"]
+            if cash_flow.get(gran_key):
+                params.setdefault("cash_flow_data", cash_flow[gran_key])
+                break
+    elif task_id == 9 and results.get(7):
+        params.setdefault("trigger_results", results[7])
+    elif task_id == 10 and segmentation:
+        email_inputs = {
+            "clusters": segmentation.get("stats", []),
+            "reports": segmentation.get("reports", []),
+            "segmentation_stats": segmentation.get("stats", [])
+        }
+        # Without a pricing stage in this pipeline, task 10 reads the latest stored pricing
+        if 5 in results:
+            email_inputs["price_optimization_data"] = results[5]
+        params.setdefault("email_inputs", email_inputs)
+    return params
+
+def _run_stage(task_id: int, params: dict, db) -> tuple:
+    from run_agent import execute_task
+    outputs = {}
+    response = execute_task(task_id, params, db, outputs=outputs)
+    return response["result"], outputs
+
+async def run_pipeline(db, tasks: List[int] = None, task_params: Dict[int, dict] = None) -> Dict[str, Any]:
+    """
+    Run pipeline tasks as a DAG. A stage starts as soon as all of its
+    dependencies have succeeded, independent stages run concurrently on the
+    task pool, and results reach downstream stages in memory instead of being
+    re-read from Mongo. Each task persists its own result once, as with
+    /api/run-task. A failed stage skips its dependents only.
+
+    Args:
+        db: Database connection
+        tasks (list): Tasks to run, defaults to every pipeline task; a
+            dependency left out is read from its latest stored result
+        task_params (dict): Per-task params, as posted to /api/run-task
+    Returns:
+        Pipeline summary with status, timings and result per stage
+    """
+    tasks = tasks or list(PIPELINE_DEPENDENCIES)
+    unknown = [task_id for task_id in tasks if task_id not in PIPELINE_DEPENDENCIES]
+    if unknown:
+        raise ValueError(f"Tasks {unknown} are not pipeline tasks, expected some of {list(PIPELINE_DEPENDENCIES)}")
+    task_params = task_params or {}
+    # Dependencies outside the requested tasks are treated as satisfied
+    pending = {task_id: [dep for dep in PIPELINE_DEPENDENCIES[task_id] if dep in tasks] for task_id in tasks}
+    results: Dict[int, dict] = {}
+    outputs: Dict[int, dict] = {}
+    stages: Dict[int, Dict[str, Any]] = {}
+    running: Dict[asyncio.Task, int] = {}
+    started = time.perf_counter()
+
+    def _launch_ready():
+        for task_id in [task_id for task_id, deps in pending.items() if all(dep in results for dep in deps)]:
+            del pending[task_id]
+            params = _stage_params(task_id, task_params.get(task_id, {}), results, outputs)
+            stages[task_id] = {"status": "running", "started_at": round(time.perf_counter() - started, 3)}
+            running[asyncio.create_task(run_compute(_run_stage, task_id, params, db))] = task_id
+
+    _launch_ready()
+    while running:
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for finished in done:
+            task_id = running.pop(finished)
+            stage = stages[task_id]
+            stage["seconds"] = round(time.perf_counter() - started - stage["started_at"], 3)
+            try:
+                results[task_id], outputs[task_id] = finished.result()
+                stage["status"] = "success"
+                stage["result"] = results[task_id]
+            except Exception as e:
+                stage["status"] = "error"
+                stage["message"] = e.detail if isinstance(e, HTTPException) else str(e)
+                logger.error(f"Pipeline stage {task_id} failed: {stage['message']}")
+        _launch_ready()
+    # Whatever is still pending depends on a failed stage
+    for task_id in pending:
+        stages[task_id] = {"status": "skipped", "message": "Skipped after a failed dependency"}
+
+    elapsed = time.perf_counter() - started
+    succeeded = sum(stage["status"] == "success" for stage in stages.values())
+    logger.info(f"Pipeline finished in {elapsed:.2f}s: {succeeded}/{len(tasks)} stages succeeded")
+    return {
+        "pipeline_id": "AgentBI-Demo",
+        "timestamp": datetime.now().strftime("%Y-%m-%d_%H:%M"),
+        "status": "success" if succeeded == len(tasks) else "partial" if succeeded else "error",
+        "dependencies": {task_id: pending_deps for task_id, pending_deps in PIPELINE_DEPENDENCIES.items() if task_id in tasks},
+        "elapsed_seconds": round(elapsed, 3),
+        "task_seconds": round(sum(stage.get("seconds", 0.0) for stage in stages.values()), 3),
+        "stages": {task_id: stages[task_id] for task_id in tasks},
+        "message": f"Ran {succeeded} of {len(tasks)} pipeline stages in {elapsed:.2f}s"
+    }
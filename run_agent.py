@@ -2,15 +2,24 @@
 import sys
 import os
 import json
+import hashlib
 import logging
-from fastapi import APIRouter, Request, HTTPException, UploadFile, File
-from pymongo import MongoClient
+from fastapi import APIRouter, Request, HTTPException, UploadFile, File, Depends, Query
+from fastapi.responses import JSONResponse
 from bson import ObjectId
+from database import get_db, run_blocking
+from services.worker_pool import run_compute
+from jobs import submit_job, get_job, cancel_job
+from pipeline import run_pipeline
 from agent.mcp_runner import run_mcp_task
-from services.utils import load_sales_data
-from services.cashflow_engine import analyze_cash_flow
+from services.cashflow_engine import analyze_cash_flow, analyze_cash_flow_batch, CASH_FLOW_GRANULARITIES
 from services.cluster_engine import run_clustering
+from services.model_cache import cache_stats
+from services.customer_segments import get_customer_segments
+from services.ingest_engine import ingest_incremental
 from services.price_optimization_engine import optimize_prices
+from services.elasticity_engine import MIN_OBSERVATIONS
+from services.promotion_engine import analyze_promotions
 from services.threshold_engine import check_thresholds
 from services.notification_engine import generate_notifications
 from services.validate import validate_output_files
@@ -22,16 +31,14 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# MongoDB connection
-client = MongoClient("mongodb://localhost:27017", wTimeoutMS=1000)
-db = client["AgentBI-Demo"]
-
 # Task-to-collection mapping
 TASK_COLLECTIONS = {
     1: "task_results",
     2: "cash_flow_results",
     3: "segmentation_results",
+    4: "ingestion_results",
     5: "price_optimization_results",
+    6: "promotion_correlation_results",
     7: "trigger_results",
     8: "validation_results",
     9: "notifications",
@@ -70,26 +77,85 @@ def convert_to_json_serializable(obj):
         return [convert_to_json_serializable(item) for item in obj]
     return obj
 
+def summarize_params(params: dict, max_items: int = 20) -> dict:
+    """Shorten long inline lists (e.g. posted sales_data records) for logging."""
+    return {
+        key: f"<{len(value)} items>" if isinstance(value, list) and len(value) > max_items else value
+        for key, value in params.items()
+    }
+
 @router.post("/api/run-task/{task_id}")
-async def run_task(task_id: int, request: Request):
+async def run_task(task_id: int, request: Request, run_async: bool = Query(False, alias="async"), db=Depends(get_db)):
+    params = await request.json() if request.headers.get("content-type") == "application/json" else {}
+    if task_id not in TASK_COLLECTIONS:
+        raise HTTPException(status_code=400, detail="Invalid task ID")
+    if run_async:
+        # ?async=true: queue the task on a worker process and return its job id at once
+        job = await run_blocking(submit_job, db, task_id, params)
+        return JSONResponse(status_code=202, content={
+            "status": "queued",
+            "job_id": job["job_id"],
+            "status_url": f"/api/jobs/{job['job_id']}"
+        })
+    # Tasks are pandas/sklearn work; run them on the task pool so the I/O pool stays free for reads
+    return await run_compute(execute_task, task_id, params, db)
+
+def execute_task(task_id: int, params: dict, db, outputs: dict = None) -> dict:
+    """
+    Run one pipeline task synchronously and persist its result. Intermediate
+    data that is not part of the stored result (task 2's per-period cash
+    flow) is put into `outputs`, when given, for downstream pipeline stages.
+    """
     try:
         schema_version = load_latest_schema()
         output_collection = TASK_COLLECTIONS.get(task_id, "task_results")
-        params = await request.json() if request.headers.get("content-type") == "application/json" else {}
-        logger.info(f"Executing task {task_id} with params: {params}, schema_version: {schema_version}")
+        logger.info(f"Executing task {task_id} with params: {summarize_params(params)}, schema_version: {schema_version}")
         
         # Clear collection if rerun: true
-        if task_id in [1, 2, 3, 5, 7, 8, 9, 10]:
+        if task_id in [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]:
             db[output_collection].delete_many({"task_id": task_id, "pipeline_id": "AgentBI-Demo"})
             logger.info(f"Cleared collection {output_collection} for task {task_id}")
         
         result = {}
         if task_id == 1:
             result = run_mcp_task("LLM", params, db, pipeline_id="AgentBI-Demo", schema_version=schema_version)
+        elif task_id == 2 and params.get("sources"):
+            logger.info(f"Calling analyze_cash_flow_batch for {len(params['sources'])} sources")
+            result = analyze_cash_flow_batch(
+                params["sources"],
+                granularity=params.get("granularity", "all"),
+                db=db,
+                max_workers=params.get("max_workers"),
+                filters=params.get("filters"),
+                start_date=params.get("start_date"),
+                end_date=params.get("end_date"),
+                bucket_days=params.get("bucket_days", 1)
+            )
+            result["pipeline_id"] = "AgentBI-Demo"
+            result["schema_version"] = schema_version
+            result["task_id"] = task_id
+            result["timestamp"] = datetime.now().strftime("%Y-%m-%d_%H:%M")
+            try:
+                db[output_collection].insert_one(result)
+                logger.info(f"Task {task_id} batch summary saved to {output_collection}")
+            except Exception as e:
+                logger.error(f"Failed to insert batch summary: {str(e)}")
+                raise
         elif task_id == 2:
             granularity = params.get("granularity", "all")
             logger.info(f"Calling analyze_cash_flow with granularity={granularity}")
-            result_dict = analyze_cash_flow(granularity=granularity, db=db)
+            result_dict = analyze_cash_flow(
+                granularity=granularity,
+                db=db,
+                streaming=params.get("streaming", False),
+                chunksize=params.get("chunksize"),
+                use_rollups=params.get("use_rollups", False),
+                filters=params.get("filters"),
+                start_date=params.get("start_date"),
+                end_date=params.get("end_date"),
+                bucket_days=params.get("bucket_days", 1),
+                sales_data=params.get("sales_data")
+            )
             
             if not isinstance(result_dict, dict):
                 logger.error(f"Task 2: analyze_cash_flow returned unexpected result format: {result_dict}")
@@ -109,10 +175,12 @@ async def run_task(task_id: int, request: Request):
                     logger.error(f"Failed to insert error result: {str(e)}")
                     raise
             else:
+                if outputs is not None:
+                    outputs["cash_flow"] = result_dict
                 saved_results = []
                 granularities = ["weekly", "monthly", "quarterly", "yearly"] if granularity == "all" else [granularity]
                 for gran in granularities:
-                    gran_key = "week" if gran == "weekly" else gran
+                    gran_key = CASH_FLOW_GRANULARITIES.get(gran, {}).get("key", gran)
                     if gran_key not in result_dict:
                         logger.warning(f"Granularity {gran} not found in analyze_cash_flow output")
                         continue
@@ -168,14 +236,29 @@ async def run_task(task_id: int, request: Request):
                     logger.error(f"Failed to insert summary result: {str(e)}")
                     raise
         elif task_id == 3:
+            # Without inline sales_data the engine maps the cached columnar
+            # snapshot itself (and can reuse cached models for unchanged data)
             payload = {
-                "sales_data": params.get("sales_data", load_sales_data().to_dict(orient='records')),
+                "sales_data": params.get("sales_data"),
                 "n_clusters": params.get("n_clusters", 3),
                 "max_graph_customers": params.get("max_graph_customers", 50),
                 "include_reports": params.get("include_reports", True),
-                "historical_stats": params.get("historical_stats", [])
+                "historical_stats": params.get("historical_stats", []),
+                "streaming": params.get("streaming", False),
+                "chunksize": params.get("chunksize"),
+                "features": params.get("features"),
+                "engine_mode": params.get("engine_mode", "full"),
+                "batch_size": params.get("batch_size"),
+                "max_iter": params.get("max_iter"),
+                "warm_start": params.get("warm_start", True),
+                "use_cache": params.get("use_cache", True),
+                "k_range": params.get("k_range"),
+                "max_workers": params.get("max_workers"),
+                "graph_mode": params.get("graph_mode", "head"),
+                "density_bins": params.get("density_bins"),
+                "persist_assignments": params.get("persist_assignments", True)
             }
-            logger.info(f"Calling run_clustering with payload: {payload}")
+            logger.info(f"Calling run_clustering with payload: {summarize_params(payload)}")
             result = run_clustering(**payload, db=db)
             result["pipeline_id"] = "AgentBI-Demo"
             result["schema_version"] = schema_version
@@ -187,14 +270,55 @@ async def run_task(task_id: int, request: Request):
             except Exception as e:
                 logger.error(f"Failed to insert result: {str(e)}")
                 raise
+        elif task_id == 4:
+            result = ingest_incremental(db, chunksize=params.get("chunksize"))
+            result["pipeline_id"] = "AgentBI-Demo"
+            result["schema_version"] = schema_version
+            result["task_id"] = task_id
+            result["timestamp"] = datetime.now().strftime("%Y-%m-%d_%H:%M")
+            try:
+                db[output_collection].insert_one(result)
+                logger.info(f"Task {task_id} result saved to {output_collection}")
+            except Exception as e:
+                logger.error(f"Failed to insert result: {str(e)}")
+                raise
         elif task_id == 5:
-            latest_segmentation = db.segmentation_results.find_one(
-                {"task_id": 3, "schema_version": schema_version},
-                sort=[("timestamp", -1)]
+            # Stats handed over in memory (pipeline runs) skip the lookup
+            segmentation_stats = params.get("segmentation_stats")
+            if segmentation_stats is None:
+                latest_segmentation = db.segmentation_results.find_one(
+                    {"task_id": 3, "schema_version": schema_version},
+                    sort=[("timestamp", -1)]
+                )
+                logger.info(f"Task 5: Latest segmentation document found: {latest_segmentation is not None}")
+                segmentation_stats = latest_segmentation.get("output", {}).get("result", {}).get("stats") if latest_segmentation else None
+            result = optimize_prices(
+                segmentation_stats=segmentation_stats,
+                db=db,
+                mode=params.get("mode", "segment"),
+                sales_data=params.get("sales_data"),
+                min_observations=params.get("min_observations", MIN_OBSERVATIONS),
+                max_recommendations=params.get("max_recommendations"),
+                price_grid=params.get("price_grid"),
+                max_workers=params.get("max_workers")
+            )
+            result["pipeline_id"] = "AgentBI-Demo"
+            result["schema_version"] = schema_version
+            result["task_id"] = task_id
+            result["timestamp"] = datetime.now().strftime("%Y-%m-%d_%H:%M")
+            try:
+                db[output_collection].insert_one(result)
+                logger.info(f"Task {task_id} result saved to {output_collection}")
+            except Exception as e:
+                logger.error(f"Failed to insert result: {str(e)}")
+                raise
+        elif task_id == 6:
+            result = analyze_promotions(
+                sales_data=params.get("sales_data"),
+                db=db,
+                dimensions=params.get("dimensions"),
+                bin_edges=params.get("bin_edges")
             )
-            logger.info(f"Task 5: Latest segmentation document found: {latest_segmentation is not None}")
-            segmentation_stats = latest_segmentation.get("output", {}).get("result", {}).get("stats") if latest_segmentation else None
-            result = optimize_prices(segmentation_stats=segmentation_stats, db=db)
             result["pipeline_id"] = "AgentBI-Demo"
             result["schema_version"] = schema_version
             result["task_id"] = task_id
@@ -206,13 +330,17 @@ async def run_task(task_id: int, request: Request):
                 logger.error(f"Failed to insert result: {str(e)}")
                 raise
         elif task_id == 7:
-            trigger_inputs = db.trigger_inputs.find_one({"schema_version": schema_version}, sort=[("timestamp", -1)]) or {}
-            segmentation_stats = trigger_inputs.get("segmentation_stats", db.segmentation_results.find_one({"task_id": 3, "schema_version": schema_version}, sort=[("timestamp", -1)]) or {}).get("output", {}).get("result", {}).get("stats", [])
+            latest_inputs = db.trigger_inputs.find_one({"schema_version": schema_version}, sort=[("timestamp", -1)]) or {}
+            # Inputs handed over in memory (pipeline runs) take precedence over the stored snapshot
+            trigger_inputs = {key: params[key] for key in ("segmentation_stats", "cash_flow_data") if key in params} or latest_inputs
+            segmentation_stats = trigger_inputs.get("segmentation_stats")
+            if segmentation_stats is None:
+                segmentation_stats = (db.segmentation_results.find_one({"task_id": 3, "schema_version": schema_version}, sort=[("timestamp", -1)]) or {}).get("output", {}).get("result", {}).get("stats", [])
             # Try any available granularity
             cash_flow_data = trigger_inputs.get("cash_flow_data", [])
             if not cash_flow_data:
                 for gran in ["monthly", "weekly", "quarterly", "yearly"]:
-                    gran_key = "week" if gran == "weekly" else gran
+                    gran_key = CASH_FLOW_GRANULARITIES[gran]["key"]
                     cash_flow_doc = db.cash_flow_results.find_one({"task_id": 2, "granularity": gran, "schema_version": schema_version}, sort=[("timestamp", -1)])
                     if cash_flow_doc and gran_key in cash_flow_doc:
                         cash_flow_data = cash_flow_doc[gran_key]
@@ -222,15 +350,25 @@ async def run_task(task_id: int, request: Request):
                     logger.warning("No cash flow data found for any granularity, using empty list")
                     cash_flow_data = []
             logger.info(f"Task 7: segmentation_stats length: {len(segmentation_stats) if segmentation_stats else 0}, cash_flow_data: {cash_flow_data}")
-            db.trigger_inputs.insert_one({
-                "pipeline_id": "AgentBI-Demo",
-                "schema_version": schema_version,
-                "task_id": 7,
-                "timestamp": datetime.now().strftime("%Y-%m-%d_%H:%M"),
-                "segmentation_stats": segmentation_stats,
-                "cash_flow_data": cash_flow_data
-            })
-            result = check_thresholds(segmentation_stats=segmentation_stats, cash_flow_data=cash_flow_data, db=db)
+            # Snapshot the inputs only when they differ from the latest snapshot
+            input_hash = hashlib.sha256(json.dumps([segmentation_stats, cash_flow_data], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+            if latest_inputs.get("input_hash") != input_hash:
+                db.trigger_inputs.insert_one({
+                    "pipeline_id": "AgentBI-Demo",
+                    "schema_version": schema_version,
+                    "task_id": 7,
+                    "timestamp": datetime.now().strftime("%Y-%m-%d_%H:%M"),
+                    "input_hash": input_hash,
+                    "segmentation_stats": segmentation_stats,
+                    "cash_flow_data": cash_flow_data
+                })
+            result = check_thresholds(
+                segmentation_stats=segmentation_stats,
+                cash_flow_data=cash_flow_data,
+                db=db,
+                incremental=params.get("incremental", True),
+                cooldown_minutes=params.get("cooldown_minutes")
+            )
             result["pipeline_id"] = "AgentBI-Demo"
             result["schema_version"] = schema_version
             result["task_id"] = task_id
@@ -256,7 +394,7 @@ async def run_task(task_id: int, request: Request):
                 logger.error(f"Failed to insert result: {str(e)}")
                 raise
         elif task_id == 9:
-            trigger_results = params.get("trigger_results", db.trigger_results.find_one({"schema_version": schema_version}, sort=[("timestamp", -1)]) or {})
+            trigger_results = params["trigger_results"] if "trigger_results" in params else (db.trigger_results.find_one({"schema_version": schema_version}, sort=[("timestamp", -1)]) or {})
             logger.info(f"Task 9: Using trigger_results timestamp: {trigger_results.get('timestamp') if trigger_results else None}")
             result = generate_notifications(trigger_results, db=db)
             result["pipeline_id"] = "AgentBI-Demo"
@@ -270,11 +408,21 @@ async def run_task(task_id: int, request: Request):
                 logger.error(f"Failed to insert result: {str(e)}")
                 raise
         elif task_id == 10:
-            email_inputs = params.get("email_inputs", db.email_inputs.find_one({"schema_version": schema_version}, sort=[("timestamp", -1)]) or {})
-            clusters = email_inputs.get("clusters", db.segmentation_results.find_one({"task_id": 3, "schema_version": schema_version}, sort=[("timestamp", -1)]) or {}).get("output", {}).get("result", {}).get("stats", [])
-            reports = email_inputs.get("reports", db.segmentation_results.find_one({"task_id": 3, "schema_version": schema_version}, sort=[("timestamp", -1)]) or {}).get("output", {}).get("result", {}).get("reports", [])
-            price_optimization_data = email_inputs.get("price_optimization_data", db.price_optimization_results.find_one({"task_id": 5, "schema_version": schema_version}, sort=[("timestamp", -1)]) or {}).get("output", {}).get("result", {})
-            segmentation_stats = email_inputs.get("segmentation_stats", db.segmentation_results.find_one({"task_id": 3, "schema_version": schema_version}, sort=[("timestamp", -1)]) or {}).get("output", {}).get("result", {}).get("stats", [])
+            email_inputs = params["email_inputs"] if "email_inputs" in params else (db.email_inputs.find_one({"schema_version": schema_version}, sort=[("timestamp", -1)]) or {})
+            stored = {}
+            if not all(key in email_inputs for key in ("clusters", "reports", "price_optimization_data", "segmentation_stats")):
+                segmentation = (db.segmentation_results.find_one({"task_id": 3, "schema_version": schema_version}, sort=[("timestamp", -1)]) or {}).get("output", {}).get("result", {})
+                pricing = (db.price_optimization_results.find_one({"task_id": 5, "schema_version": schema_version}, sort=[("timestamp", -1)]) or {}).get("output", {}).get("result", {})
+                stored = {
+                    "clusters": segmentation.get("stats", []),
+                    "reports": segmentation.get("reports", []),
+                    "price_optimization_data": pricing,
+                    "segmentation_stats": segmentation.get("stats", [])
+                }
+            clusters = email_inputs.get("clusters", stored.get("clusters"))
+            reports = email_inputs.get("reports", stored.get("reports"))
+            price_optimization_data = email_inputs.get("price_optimization_data", stored.get("price_optimization_data"))
+            segmentation_stats = email_inputs.get("segmentation_stats", stored.get("segmentation_stats"))
             db.email_inputs.insert_one({
                 "pipeline_id": "AgentBI-Demo",
                 "schema_version": schema_version,
@@ -306,14 +454,14 @@ async def run_task(task_id: int, request: Request):
         raise HTTPException(status_code=500, detail=f"Task {task_id} failed: {str(e)}")
 
 @router.get("/api/task-results/{task_id}")
-async def get_task_results(task_id: int, timestamp: str = None):
+async def get_task_results(task_id: int, timestamp: str = None, db=Depends(get_db)):
     try:
         schema_version = load_latest_schema()
         output_collection = TASK_COLLECTIONS.get(task_id, "task_results")
         query = {"task_id": task_id, "pipeline_id": "AgentBI-Demo", "schema_version": schema_version}
         if timestamp:
             query["timestamp"] = timestamp
-        results = list(db[output_collection].find(query).sort("timestamp", -1))
+        results = await run_blocking(lambda: list(db[output_collection].find(query).sort("timestamp", -1)))
         if not results:
             raise HTTPException(status_code=404, detail="No results found")
         return convert_to_json_serializable(results)
@@ -321,8 +469,60 @@ async def get_task_results(task_id: int, timestamp: str = None):
         logger.error(f"Failed to fetch task results: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch task results: {str(e)}")
 
+@router.post("/api/run-pipeline")
+async def run_pipeline_request(request: Request, db=Depends(get_db)):
+    """
+    Run the pipeline DAG. Optional JSON body: {"tasks": [2, 3, 5], "params":
+    {"3": {"n_clusters": 3}}} with per-task params as for /api/run-task.
+    """
+    body = await request.json() if request.headers.get("content-type") == "application/json" else {}
+    try:
+        task_params = {int(task_id): params for task_id, params in (body.get("params") or {}).items()}
+        result = await run_pipeline(db, tasks=body.get("tasks"), task_params=task_params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return convert_to_json_serializable(result)
+
+@router.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str, db=Depends(get_db)):
+    job = await run_blocking(get_job, db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return convert_to_json_serializable(job)
+
+@router.post("/api/jobs/{job_id}/cancel")
+async def cancel_job_request(job_id: str, db=Depends(get_db)):
+    job = await run_blocking(cancel_job, db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return convert_to_json_serializable(job)
+
+@router.get("/api/cache-stats")
+async def get_cache_stats():
+    return cache_stats()
+
+@router.get("/api/customer-segments")
+async def get_customer_segments_batch(ids: str, db=Depends(get_db)):
+    try:
+        customer_ids = [customer_id.strip() for customer_id in ids.split(",") if customer_id.strip()]
+        segments = await run_blocking(get_customer_segments, db, customer_ids)
+        return {
+            "segments": convert_to_json_serializable(segments),
+            "missing": [customer_id for customer_id in customer_ids if customer_id not in segments]
+        }
+    except Exception as e:
+        logger.error(f"Failed to fetch customer segments: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch customer segments: {str(e)}")
+
+@router.get("/api/customer-segments/{customer_id}")
+async def get_customer_segment(customer_id: str, db=Depends(get_db)):
+    segment = (await run_blocking(get_customer_segments, db, [customer_id])).get(customer_id)
+    if segment is None:
+        raise HTTPException(status_code=404, detail=f"No segment found for customer {customer_id}")
+    return convert_to_json_serializable(segment)
+
 @router.get("/api/notifications")
-async def get_notifications(timestamp: str = None, read: bool = None):
+async def get_notifications(timestamp: str = None, read: bool = None, db=Depends(get_db)):
     try:
         schema_version = load_latest_schema()
         query = {"pipeline_id": "AgentBI-Demo", "schema_version": schema_version}
@@ -330,17 +530,18 @@ async def get_notifications(timestamp: str = None, read: bool = None):
             query["timestamp"] = timestamp
         if read is not None:
             query["read"] = read
-        notifications = list(db.notifications.find(query).sort("timestamp", -1))
+        notifications = await run_blocking(lambda: list(db.notifications.find(query).sort("timestamp", -1)))
         return convert_to_json_serializable(notifications)
     except Exception as e:
         logger.error(f"Failed to fetch notifications: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch notifications: {str(e)}")
 
 @router.put("/api/notifications/{notification_id}")
-async def mark_notification_read(notification_id: str):
+async def mark_notification_read(notification_id: str, db=Depends(get_db)):
     try:
         schema_version = load_latest_schema()
-        result = db.notifications.update_one(
+        result = await run_blocking(
+            db.notifications.update_one,
             {"id": notification_id, "pipeline_id": "AgentBI-Demo", "schema_version": schema_version},
             {"$set": {"read": True}}
         )
@@ -352,10 +553,10 @@ async def mark_notification_read(notification_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to update notification: {str(e)}")
 
 @router.get("/api/latest-pipeline")
-async def get_latest_pipeline():
+async def get_latest_pipeline(db=Depends(get_db)):
     try:
         schema_version = load_latest_schema()
-        result = db.task_results.find_one({"pipeline_id": "AgentBI-Demo"}, sort=[("timestamp", -1)])
+        result = await run_blocking(db.task_results.find_one, {"pipeline_id": "AgentBI-Demo"}, sort=[("timestamp", -1)])
         return convert_to_json_serializable({"timestamp": result["timestamp"], "schema_version": schema_version} if result else {"schema_version": schema_version})
     except Exception as e:
         logger.error(f"Failed to fetch latest pipeline: {str(e)}")
@@ -1,26 +1,294 @@
 
+import os
+import json
+import uuid
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import as_completed
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from services.utils import load_sales_data
+from datetime import datetime
+from services.utils import SALES_DATA_PATH, iter_sales_chunks, to_day_numbers, day_numbers_to_datetime
+from services.snapshot_cache import source_fingerprint
+from services.ingest_engine import load_daily_rollups
+from services.rollup_cube import cube_daily_sales
+from services.worker_pool import submit_all
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def analyze_cash_flow(granularity: str = "all", db=None, **kwargs) -> dict:
+# Each granularity is a lookback window from the latest date split into labelled
+# buckets, scaled so the window total matches the demo's expected total.
+CASH_FLOW_GRANULARITIES = {
+    "weekly": {
+        "key": "week",
+        "lookback_days": 6,
+        "labels": ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
+        "target_total": 117900.0
+    },
+    "monthly": {
+        "key": "month",
+        "lookback_days": 30,
+        "labels": ['Week 1', 'Week 2', 'Week 3', 'Week 4'],
+        "target_total": 439200.0
+    },
+    "quarterly": {
+        "key": "quarter",
+        "lookback_days": 90,
+        "labels": ['Month 1', 'Month 2', 'Month 3'],
+        "target_total": 1448300.0
+    },
+    "yearly": {
+        "key": "year",
+        "lookback_days": 365,
+        "labels": ['Q1', 'Q2', 'Q3', 'Q4'],
+        "target_total": 6523600.0
+    }
+}
+
+MAX_RANGE_BUCKETS = 5000
+RANGE_INDEX_CACHE_CAPACITY = 16
+
+# LRU of prefix-sum indexes per data version and drill-down slice:
+# {(path, sha256, filters): index}, most recently used last
+_range_indexes: "OrderedDict[tuple, dict]" = OrderedDict()
+_range_indexes_lock = threading.Lock()
+
+def build_cash_flow_index(days: np.ndarray, sales: np.ndarray) -> dict:
+    """
+    Build a prefix-sum index over daily sales, profit and expenses.
+
+    The index holds the sorted distinct days and cumulative sums with a leading
+    zero, so the total over any day range is cum[hi] - cum[lo] once the bounds
+    are located with a binary search.
+    """
+    order = np.argsort(days, kind='stable')
+    days, sales = days[order], sales[order]
+    distinct_days, starts = np.unique(days, return_index=True)
+    daily_sales = np.add.reduceat(sales, starts) if len(sales) else np.zeros(0)
+    cumulative = np.concatenate([[0.0], np.cumsum(daily_sales)])
+    return {
+        "days": distinct_days,
+        "sales": cumulative,
+        "profit": np.concatenate([[0.0], np.cumsum(daily_sales * 0.3)]),
+        "expenses": np.concatenate([[0.0], np.cumsum(daily_sales * 0.7)])
+    }
+
+def _cached_cash_flow_index(file_path: str = None, filters: dict = None) -> dict:
+    file_path = os.path.abspath(file_path or SALES_DATA_PATH)
+    key = (file_path, source_fingerprint(file_path)["sha256"], json.dumps(filters or {}, sort_keys=True))
+    with _range_indexes_lock:
+        index = _range_indexes.get(key)
+        if index is not None:
+            _range_indexes.move_to_end(key)
+            return index
+    daily = cube_daily_sales(file_path, filters)
+    index = build_cash_flow_index(to_day_numbers(daily['OrderDate']), daily['Sales'].to_numpy(dtype=np.float64))
+    with _range_indexes_lock:
+        _range_indexes[key] = index
+        _range_indexes.move_to_end(key)
+        while len(_range_indexes) > RANGE_INDEX_CACHE_CAPACITY:
+            _range_indexes.popitem(last=False)
+    return index
+
+def query_cash_flow_range(index: dict, start_date=None, end_date=None, bucket_days: int = 1) -> dict:
+    """
+    Sum sales, profit and expenses over [start_date, end_date] in buckets of
+    bucket_days days. Costs O(log n) per bucket edge plus O(buckets).
+    """
+    days = index["days"]
+    if len(days) == 0:
+        return {"records": [], "total_sales": 0.0, "total_profit": 0.0}
+    bucket_days = int(bucket_days or 1)
+    if bucket_days < 1:
+        raise ValueError("bucket_days must be at least 1")
+    start_day = int(to_day_numbers([start_date])[0]) if start_date else int(days[0])
+    end_day = int(to_day_numbers([end_date])[0]) if end_date else int(days[-1])
+    if start_day < 0 or end_day < 0:
+        raise ValueError(f"Invalid date range: {start_date} to {end_date}")
+    if end_day < start_day:
+        raise ValueError(f"end_date {end_date} is before start_date {start_date}")
+    n_buckets = (end_day - start_day) // bucket_days + 1
+    if n_buckets > MAX_RANGE_BUCKETS:
+        raise ValueError(f"Range produces {n_buckets} buckets, more than the limit of {MAX_RANGE_BUCKETS}")
+
+    bucket_starts = start_day + bucket_days * np.arange(n_buckets)
+    edges = np.append(bucket_starts, end_day + 1)
+    positions = np.searchsorted(days, edges, side='left')
+    sums = {measure: np.diff(index[measure][positions]) for measure in ("sales", "profit", "expenses")}
+    bucket_ends = np.minimum(bucket_starts + bucket_days - 1, end_day)
+    records = [
+        {"period": period, "start": period, "end": end, "sales": s, "profit": p, "expenses": e}
+        for period, end, s, p, e in zip(
+            day_numbers_to_datetime(bucket_starts).strftime("%Y-%m-%d").tolist(),
+            day_numbers_to_datetime(bucket_ends).strftime("%Y-%m-%d").tolist(),
+            np.round(sums["sales"], 2).tolist(),
+            np.round(sums["profit"], 2).tolist(),
+            np.round(sums["expenses"], 2).tolist()
+        )
+    ]
+    return {
+        "records": records,
+        "total_sales": float(sums["sales"].sum()),
+        "total_profit": float(sums["profit"].sum())
+    }
+
+def _bucket_codes(days: np.ndarray, latest_day: int) -> dict:
+    """
+    Integer bucket code of every day for every granularity, from one pass of
+    calendar arithmetic: weekday (Mon=0) for weekly, week of month for monthly,
+    and months/quarters back from the latest date for quarterly/yearly.
+    """
+    dates = days.astype('M8[D]')
+    months = dates.astype('M8[M]').astype(np.int64)
+    day_of_month = (dates - dates.astype('M8[M]').astype('M8[D]')).astype(np.int64)
+    latest_month = int(np.datetime64(latest_day, 'D').astype('M8[M]').astype(np.int64))
+    return {
+        "weekly": (days.astype(np.int64) + 3) % 7,  # 1970-01-01 was a Thursday
+        "monthly": day_of_month // 7,
+        "quarterly": latest_month - months,
+        "yearly": latest_month // 3 - months // 3
+    }
+
+def _bucket_cash_flow(days: np.ndarray, sales: np.ndarray, granularities: list) -> dict:
+    """
+    Sum sales into every requested granularity's buckets with one bincount each
+    and turn the bucket arrays into output records. Returns, per granularity,
+    the records and the scaled sales and profit totals.
+    """
+    latest_day = int(days.max())
+    codes = _bucket_codes(days, latest_day)
+    profit = sales * 0.3
+    expenses = sales * 0.7
+    buckets = {}
+    for gran in granularities:
+        spec = CASH_FLOW_GRANULARITIES.get(gran)
+        if spec is None:
+            continue
+        n_buckets = len(spec["labels"])
+        gran_codes = codes[gran]
+        in_window = days >= latest_day - spec["lookback_days"]
+        if not in_window.any():
+            buckets[gran] = {"records": [], "total_sales": 0.0, "total_profit": 0.0}
+            continue
+        keep = in_window & (gran_codes >= 0) & (gran_codes < n_buckets)
+        # Expenses are 70% and profit 30% of sales
+        bucket_sales, bucket_profit, bucket_expenses = (
+            np.bincount(gran_codes[keep], weights=weights[keep], minlength=n_buckets)
+            for weights in (sales, profit, expenses)
+        )
+
+        total_sales = bucket_sales.sum()
+        scale_factor = spec["target_total"] / total_sales if total_sales > 0 else 1.0
+        scaled_sales = bucket_sales * scale_factor
+        scaled_profit = bucket_profit * scale_factor
+        scaled_expenses = bucket_expenses * scale_factor
+        records = [
+            {"period": period, "sales": s, "profit": p, "expenses": e}
+            for period, s, p, e in zip(
+                spec["labels"],
+                scaled_sales.astype(np.int64).tolist(),
+                scaled_profit.astype(np.int64).tolist(),
+                scaled_expenses.astype(np.int64).tolist()
+            )
+        ]
+        buckets[gran] = {
+            "records": records,
+            "total_sales": float(scaled_sales.sum()),
+            "total_profit": float(scaled_profit.sum())
+        }
+    return buckets
+
+def stream_daily_sales(file_path: str = None, chunksize: int = None) -> pd.DataFrame:
+    """
+    Build per-day sales sums by streaming the sales file chunk by chunk.
+
+    Each chunk is reduced to a partial per-day aggregate which is folded into a
+    running total, so peak memory is bounded by the chunk size plus one row per
+    day. Profit and expenses are derived from sales downstream, so the daily
+    sales sum is all the cash flow windows need.
+    """
+    daily = None
+    for chunk in iter_sales_chunks(file_path, chunksize, usecols=['CustomerID', 'OrderDate', 'Sales']):
+        chunk = chunk.dropna(subset=['Sales', 'OrderDate'])
+        partial = chunk.groupby(chunk['OrderDate'].dt.normalize())['Sales'].sum()
+        daily = partial if daily is None else daily.add(partial, fill_value=0.0)
+    if daily is None:
+        return pd.DataFrame(columns=['OrderDate', 'Sales'])
+    return daily.sort_index().rename_axis('OrderDate').reset_index()
+
+def _range_result(buckets: dict) -> dict:
+    return {
+        "task_id": 2,
+        "pipeline_id": "AgentBI-Demo",
+        "schema_version": "v0.6.2",
+        "timestamp": datetime.now().strftime("%Y-%m-%d_%H:%M"),
+        "status": "success" if buckets["records"] else "no_data",
+        "message": f"Cash flow analyzed over {len(buckets['records'])} custom buckets",
+        "custom": buckets["records"],
+        "totalSales": buckets["total_sales"],
+        "totalProfit": buckets["total_profit"],
+        "profitMargin": 30.0,
+        "trend_summary": {"Stable": len(buckets["records"])}
+    }
+
+def analyze_cash_flow(
+    granularity: str = "all",
+    db=None,
+    file_path: str = None,
+    streaming: bool = False,
+    chunksize: int = None,
+    use_rollups: bool = False,
+    filters: dict = None,
+    start_date: str = None,
+    end_date: str = None,
+    bucket_days: int = 1,
+    sales_data=None,
+    **kwargs
+) -> dict:
     """
     Analyze cash flow data for specified granularities: weekly (daily), monthly (weekly),
-    quarterly (monthly), yearly (quarterly).
+    quarterly (monthly), yearly (quarterly), or an arbitrary date range with
+    granularity 'custom'.
 
     Args:
-        granularity (str): 'weekly', 'monthly', 'quarterly', 'yearly', or 'all'
+        granularity (str): 'weekly', 'monthly', 'quarterly', 'yearly', 'all' or 'custom'
         db: Database connection (passed by pipeline executor, unused here)
+        file_path (str): Sales file to analyze, defaults to the configured sales file
+        streaming (bool): Aggregate the file chunk by chunk instead of loading it whole
+        chunksize (int): Rows per chunk in streaming mode
+        use_rollups (bool): Read the per-day rollups maintained by incremental ingestion from db
+        filters (dict): Drill-down slice of the rollup cube, e.g. {"Category": "Technology"}
+        start_date (str): First day of a 'custom' range, defaults to the first day with data
+        end_date (str): Last day (inclusive) of a 'custom' range, defaults to the latest day
+        bucket_days (int): Bucket size in days for a 'custom' range
+        sales_data: In-process DataFrame (full or compact schema) or inline JSON
+            records to analyze instead of the sales file
         **kwargs: Additional parameters from pipeline
     Returns:
         Dictionary with cash flow analysis results in the expected structure
     """
     try:
-        df = load_sales_data()
+        if granularity == "custom" and sales_data is None and not (use_rollups or streaming):
+            # Answer from the cached prefix-sum index without touching the frame
+            index = _cached_cash_flow_index(file_path, filters)
+            return _range_result(query_cash_flow_range(index, start_date, end_date, bucket_days))
+
+        if sales_data is not None:
+            df = sales_data if isinstance(sales_data, pd.DataFrame) else pd.DataFrame(sales_data)
+            if 'OrderDay' in df.columns and 'OrderDate' not in df.columns:
+                order_day = df['OrderDay'].to_numpy()
+                df = pd.DataFrame({
+                    'OrderDate': day_numbers_to_datetime(order_day).where(order_day >= 0),
+                    'Sales': df['Sales'].to_numpy()
+                })
+        elif use_rollups and db is not None:
+            df = load_daily_rollups(db, kwargs.get("pipeline_id", "AgentBI-Demo"))
+        elif streaming:
+            df = stream_daily_sales(file_path, chunksize)
+        else:
+            df = cube_daily_sales(file_path, filters)
         logger.info(f"Loaded sales data with shape: {df.shape}")
 
         # Find date and sales columns
@@ -42,7 +310,8 @@ def analyze_cash_flow(granularity: str = "all", db=None, **kwargs) -> dict:
 
         logger.info(f"Using date column: {date_col}, sales column: {sales_col}")
         
-        df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
+        # Work on a two-column frame so a caller's DataFrame is never modified
+        df = pd.DataFrame({date_col: pd.to_datetime(df[date_col], errors='coerce'), sales_col: df[sales_col]})
         df = df.dropna(subset=[sales_col, date_col])
         logger.info(f"After cleaning, data shape: {df.shape}")
         
@@ -61,10 +330,6 @@ def analyze_cash_flow(granularity: str = "all", db=None, **kwargs) -> dict:
                 "year": []
             }
 
-        # Calculate expenses (70% of sales) and profit (30% of sales)
-        df['Expenses'] = df[sales_col] * 0.7
-        df['Profit'] = df[sales_col] * 0.3
-
         result = {
             "task_id": 2,
             "pipeline_id": "AgentBI-Demo",
@@ -82,155 +347,28 @@ def analyze_cash_flow(granularity: str = "all", db=None, **kwargs) -> dict:
             "trend_summary": {"Stable": 0}
         }
 
-        latest_date = df[date_col].max()
-        logger.info(f"Latest date in data: {latest_date}")
-        granularities = ['weekly', 'monthly', 'quarterly', 'yearly'] if granularity == "all" else [granularity]
+        days = to_day_numbers(df[date_col])
+        sales = df[sales_col].to_numpy(dtype=np.float64)
+        if granularity == "custom":
+            index = build_cash_flow_index(days, sales)
+            return _range_result(query_cash_flow_range(index, start_date, end_date, bucket_days))
+        logger.info(f"Latest date in data: {df[date_col].max()}")
+        granularities = list(CASH_FLOW_GRANULARITIES) if granularity == "all" else [granularity]
+        buckets = _bucket_cash_flow(days, sales, granularities)
 
         for gran in granularities:
-            key_name = "week" if gran == "weekly" else gran.replace("ly", "")  # weekly -> week, monthly -> month, etc.
-            
-            if gran == 'weekly':
-                # Last 7 days, grouped by day of week
-                start_date = latest_date - timedelta(days=6)
-                df_week = df[df[date_col] >= start_date].copy()
-                logger.info(f"Weekly data shape (after filtering {start_date} to {latest_date}): {df_week.shape}")
-                if not df_week.empty:
-                    df_week['Day'] = df_week[date_col].dt.day_name().str[:3]
-                    week_data = df_week.groupby('Day').agg({
-                        sales_col: 'sum',
-                        'Profit': 'sum',
-                        'Expenses': 'sum'
-                    }).reindex(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']).fillna(0).reset_index()
-                    
-                    # Scale to match expected totals (weekly total ~117900)
-                    total_sales = week_data[sales_col].sum()
-                    scale_factor = 117900.0 / total_sales if total_sales > 0 else 1.0
-                    week_data[sales_col] *= scale_factor
-                    week_data['Profit'] *= scale_factor
-                    week_data['Expenses'] *= scale_factor
-                    
-                    result["week"] = [
-                        {
-                            "period": row['Day'],
-                            "sales": int(row[sales_col]),
-                            "profit": int(row['Profit']),
-                            "expenses": int(row['Expenses'])
-                        } for _, row in week_data.iterrows()
-                    ]
-                    result["totalSales"] = float(week_data[sales_col].sum())
-                    result["totalProfit"] = float(week_data['Profit'].sum())
-                    result["trend_summary"] = {"Stable": len(week_data)}
-                else:
-                    logger.warning("No data available for weekly granularity")
-                    result["week"] = []
-
-            elif gran == 'monthly':
-                # Last 30 days, grouped by week of month
-                start_date = latest_date - timedelta(days=30)
-                df_month = df[df[date_col] >= start_date].copy()
-                logger.info(f"Monthly data shape (after filtering {start_date} to {latest_date}): {df_month.shape}")
-                if not df_month.empty:
-                    df_month['Week'] = df_month[date_col].apply(lambda x: f"Week {(x.day-1)//7 + 1}")
-                    month_data = df_month.groupby('Week').agg({
-                        sales_col: 'sum',
-                        'Profit': 'sum',
-                        'Expenses': 'sum'
-                    }).reindex(['Week 1', 'Week 2', 'Week 3', 'Week 4']).fillna(0).reset_index()
-                    
-                    # Scale to match expected totals (monthly total ~439200)
-                    total_sales = month_data[sales_col].sum()
-                    scale_factor = 439200.0 / total_sales if total_sales > 0 else 1.0
-                    month_data[sales_col] *= scale_factor
-                    month_data['Profit'] *= scale_factor
-                    month_data['Expenses'] *= scale_factor
-                    
-                    result["month"] = [
-                        {
-                            "period": row['Week'],
-                            "sales": int(row[sales_col]),
-                            "profit": int(row['Profit']),
-                            "expenses": int(row['Expenses'])
-                        } for _, row in month_data.iterrows()
-                    ]
-                    if result["totalSales"] == 0.0:  # Use monthly totals if weekly not set
-                        result["totalSales"] = float(month_data[sales_col].sum())
-                        result["totalProfit"] = float(month_data['Profit'].sum())
-                        result["trend_summary"] = {"Stable": len(month_data)}
-                else:
-                    logger.warning("No data available for monthly granularity")
-                    result["month"] = []
-
-            elif gran == 'quarterly':
-                # Last 90 days, grouped by month
-                start_date = latest_date - timedelta(days=90)
-                df_quarter = df[df[date_col] >= start_date].copy()
-                logger.info(f"Quarterly data shape (after filtering {start_date} to {latest_date}): {df_quarter.shape}")
-                if not df_quarter.empty:
-                    df_quarter['Month'] = df_quarter[date_col].dt.to_period('M').apply(lambda x: f"Month {(latest_date.to_period('M') - x).n + 1}")
-                    quarter_data = df_quarter.groupby('Month').agg({
-                        sales_col: 'sum',
-                        'Profit': 'sum',
-                        'Expenses': 'sum'
-                    }).reindex(['Month 1', 'Month 2', 'Month 3']).fillna(0).reset_index()
-                    
-                    # Scale to match expected totals (quarterly total ~1448300)
-                    total_sales = quarter_data[sales_col].sum()
-                    scale_factor = 1448300.0 / total_sales if total_sales > 0 else 1.0
-                    quarter_data[sales_col] *= scale_factor
-                    quarter_data['Profit'] *= scale_factor
-                    quarter_data['Expenses'] *= scale_factor
-                    
-                    result["quarter"] = [
-                        {
-                            "period": row['Month'],
-                            "sales": int(row[sales_col]),
-                            "profit": int(row['Profit']),
-                            "expenses": int(row['Expenses'])
-                        } for _, row in quarter_data.iterrows()
-                    ]
-                    if result["totalSales"] == 0.0:  # Use quarterly totals if not set
-                        result["totalSales"] = float(quarter_data[sales_col].sum())
-                        result["totalProfit"] = float(quarter_data['Profit'].sum())
-                        result["trend_summary"] = {"Stable": len(quarter_data)}
-                else:
-                    logger.warning("No data available for quarterly granularity")
-                    result["quarter"] = []
-
-            elif gran == 'yearly':
-                # Last 365 days, grouped by quarter
-                start_date = latest_date - timedelta(days=365)
-                df_year = df[df[date_col] >= start_date].copy()
-                logger.info(f"Yearly data shape (after filtering {start_date} to {latest_date}): {df_year.shape}")
-                if not df_year.empty:
-                    df_year['Quarter'] = df_year[date_col].dt.to_period('Q').apply(lambda x: f"Q{(latest_date.to_period('Q') - x).n + 1}")
-                    year_data = df_year.groupby('Quarter').agg({
-                        sales_col: 'sum',
-                        'Profit': 'sum',
-                        'Expenses': 'sum'
-                    }).reindex(['Q1', 'Q2', 'Q3', 'Q4']).fillna(0).reset_index()
-                    
-                    # Scale to match expected totals (yearly total ~6523600)
-                    total_sales = year_data[sales_col].sum()
-                    scale_factor = 6523600.0 / total_sales if total_sales > 0 else 1.0
-                    year_data[sales_col] *= scale_factor
-                    year_data['Profit'] *= scale_factor
-                    year_data['Expenses'] *= scale_factor
-                    
-                    result["year"] = [
-                        {
-                            "period": row['Quarter'],
-                            "sales": int(row[sales_col]),
-                            "profit": int(row['Profit']),
-                            "expenses": int(row['Expenses'])
-                        } for _, row in year_data.iterrows()
-                    ]
-                    if result["totalSales"] == 0.0:  # Use yearly totals if not set
-                        result["totalSales"] = float(year_data[sales_col].sum())
-                        result["totalProfit"] = float(year_data['Profit'].sum())
-                        result["trend_summary"] = {"Stable": len(year_data)}
-                else:
-                    logger.warning("No data available for yearly granularity")
-                    result["year"] = []
+            if gran not in buckets:
+                logger.warning(f"Unknown granularity {gran}, skipping")
+                continue
+            key_name = CASH_FLOW_GRANULARITIES[gran]["key"]
+            records = buckets[gran]["records"]
+            result[key_name] = records
+            if not records:
+                logger.warning(f"No data available for {gran} granularity")
+            elif result["totalSales"] == 0.0:  # Totals come from the first granularity with data
+                result["totalSales"] = buckets[gran]["total_sales"]
+                result["totalProfit"] = buckets[gran]["total_profit"]
+                result["trend_summary"] = {"Stable": len(records)}
 
         logger.info(f"Cash flow analysis completed for granularities: {granularities}")
         logger.info(f"Result keys: {list(result.keys())}")
@@ -249,4 +387,123 @@ def analyze_cash_flow(granularity: str = "all", db=None, **kwargs) -> dict:
             "month": [],
             "quarter": [],
             "year": []
-        }
\ No newline at end of file
+        }
+
+def _analyze_source(source_id: str, file_path: str, granularity: str, options: dict) -> dict:
+    """Process pool worker: analyze one sales source and tag the result with it."""
+    result = analyze_cash_flow(granularity=granularity, file_path=file_path, **options)
+    result["source_id"] = source_id
+    result["file_path"] = file_path
+    return result
+
+def analyze_cash_flow_batch(
+    sources: list,
+    granularity: str = "all",
+    db=None,
+    max_workers: int = None,
+    **kwargs
+) -> dict:
+    """
+    Analyze cash flow for many sales sources (e.g. one CSV per store or client)
+    in parallel across a bounded process pool.
+
+    Args:
+        sources (list): File paths, or dicts with "file_path" and an optional "source_id"
+        granularity (str): Granularity passed to analyze_cash_flow for every source
+        db: Database connection; when given, all per-source results are written to
+            cash_flow_results with one unordered insert_many
+        max_workers (int): Upper bound on worker processes, defaults to the CPU count
+        **kwargs: Options forwarded to analyze_cash_flow (filters, start_date, ...)
+    Returns:
+        Batch summary with the status of every source
+    """
+    batch_id = uuid.uuid4().hex
+    try:
+        normalized = []
+        for i, source in enumerate(sources or []):
+            if isinstance(source, str):
+                source = {"file_path": source}
+            file_path = source.get("file_path")
+            source_id = str(source.get("source_id") or (os.path.splitext(os.path.basename(file_path))[0] if file_path else i))
+            normalized.append((source_id, file_path))
+        if not normalized:
+            raise ValueError("No sales sources given")
+        source_ids = [source_id for source_id, _ in normalized]
+        duplicates = sorted({source_id for source_id in source_ids if source_ids.count(source_id) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate source ids: {duplicates}, pass an explicit source_id per source")
+
+        options = {k: v for k, v in kwargs.items() if k in (
+            "filters", "streaming", "chunksize", "start_date", "end_date", "bucket_days"
+        )}
+        workers = max(1, min(len(normalized), max_workers or os.cpu_count() or 1))
+        logger.info(f"Batch {batch_id}: analyzing {len(normalized)} sources with {workers} workers")
+
+        results = {}
+        futures = submit_all(
+            _analyze_source, [(source_id, file_path, granularity, options) for source_id, file_path in normalized], workers
+        )
+        futures = dict(zip(futures, normalized))
+        for future in as_completed(futures):
+            source_id, file_path = futures[future]
+            try:
+                results[source_id] = future.result()
+            except Exception as e:
+                logger.error(f"Batch {batch_id}: source {source_id} failed: {str(e)}")
+                results[source_id] = {
+                    "task_id": 2,
+                    "pipeline_id": "AgentBI-Demo",
+                    "schema_version": "v0.6.2",
+                    "timestamp": datetime.now().strftime("%Y-%m-%d_%H:%M"),
+                    "status": "error",
+                    "message": f"Cash flow analysis failed: {str(e)}",
+                    "source_id": source_id,
+                    "file_path": file_path
+                }
+
+        # Report sources in the order they were given
+        results = [results[source_id] for source_id, _ in normalized if source_id in results]
+        for result in results:
+            result["batch_id"] = batch_id
+            result["granularity"] = granularity
+        if db is not None:
+            db.cash_flow_results.insert_many(results, ordered=False)
+            logger.info(f"Batch {batch_id}: saved {len(results)} results to cash_flow_results")
+
+        source_statuses = [
+            {
+                "source_id": result["source_id"],
+                "file_path": result["file_path"],
+                "status": result.get("status", "error"),
+                "message": result.get("message", ""),
+                "total_sales": result.get("totalSales", 0.0),
+                "total_profit": result.get("totalProfit", 0.0),
+                "_id": str(result["_id"]) if "_id" in result else None
+            } for result in results
+        ]
+        failed = sum(1 for status in source_statuses if status["status"] == "error")
+        return {
+            "task_id": 2,
+            "pipeline_id": "AgentBI-Demo",
+            "schema_version": "v0.6.2",
+            "timestamp": datetime.now().strftime("%Y-%m-%d_%H:%M"),
+            "status": "success" if failed == 0 else ("error" if failed == len(results) else "partial"),
+            "batch_id": batch_id,
+            "granularity": granularity,
+            "sources": source_statuses,
+            "message": f"Analyzed {len(results) - failed} of {len(results)} sources",
+            "summary": True
+        }
+    except Exception as e:
+        logger.error(f"Cash flow batch failed: {str(e)}", exc_info=True)
+        return {
+            "task_id": 2,
+            "pipeline_id": "AgentBI-Demo",
+            "schema_version": "v0.6.2",
+            "timestamp": datetime.now().strftime("%Y-%m-%d_%H:%M"),
+            "status": "error",
+            "batch_id": batch_id,
+            "sources": [],
+            "message": f"Cash flow batch failed: {str(e)}",
+            "summary": True
+        }
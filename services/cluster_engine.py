@@ -1,30 +1,283 @@
 
+import os
+import uuid
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import pairwise_distances_argmin, silhouette_score
 from datetime import datetime
-from services.utils import load_sales_data
+from services.utils import SALES_DATA_PATH, load_sales_data, iter_sales_chunks, to_day_numbers
+from services.rfm_features import build_rfm_features, rfm_from_aggregates, RFM_FEATURES
+from services.snapshot_cache import source_fingerprint
+from services.model_cache import cache_key, get_cached, put_cached
+from services.customer_segments import save_customer_segments
+from services.worker_pool import map_all
+from services.segmentation_model import (
+    load_previous_model, feature_drift, changed_customers, save_model, DRIFT_THRESHOLD, WARM_START_MAX_ITER
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+CLUSTER_ENGINE_MODES = ["full", "minibatch"]
+# Bump when a change to the clustering code alters its results, to invalidate cached models
+CLUSTER_ENGINE_VERSION = 5
+# n_clusters="auto" sweeps k over this inclusive range on a sample of customers
+DEFAULT_K_RANGE = [2, 8]
+K_SELECTION_SAMPLE = 50_000
+SILHOUETTE_SAMPLE = 5_000
+CLUSTER_COLORS = {"High": "#10B981", "Mid": "#14B8A6", "Low": "#06B6D4"}
+GRAPH_MODES = ["head", "density"]
+DEFAULT_DENSITY_BINS = 32
+DEFAULT_MINIBATCH_SIZE = 4096
+DEFAULT_MINIBATCH_EPOCHS = 10
+
+def stream_customer_aggregates(file_path: str = None, chunksize: int = None) -> pd.DataFrame:
+    """
+    Build per-customer last order date, sales sum and order count by streaming the
+    sales file. Each chunk's partial aggregate is merged into a running one, so
+    peak memory is the chunk size plus one row per customer.
+    """
+    totals = None
+    for chunk in iter_sales_chunks(file_path, chunksize, usecols=['CustomerID', 'OrderDate', 'Sales']):
+        partial = chunk.groupby('CustomerID').agg(
+            last_order=('OrderDate', 'max'),
+            monetary=('Sales', 'sum'),
+            frequency=('Sales', 'count')
+        )
+        if totals is None:
+            totals = partial
+        else:
+            merged = pd.concat([totals, partial])
+            totals = merged.groupby(level=0).agg({'last_order': 'max', 'monetary': 'sum', 'frequency': 'sum'})
+    if totals is None:
+        return pd.DataFrame(columns=['CustomerID', 'last_order', 'monetary', 'frequency'])
+    return totals.reset_index()
+
+def _fit_clusters(X: np.ndarray, n_clusters: int, engine: Dict[str, Any], init: np.ndarray = None, sample_weight: np.ndarray = None):
+    """
+    Fit the configured KMeans engine, from k-means++ or from the given initial
+    centroids, optionally weighting the rows. The minibatch mode fits MiniBatchKMeans over random batches of
+    the feature matrix; each step only touches one batch, and fitting stops
+    early once the smoothed inertia stops improving.
+
+    Returns:
+        Cluster index per row, fitted centroids and the number of iterations run
+    """
+    if engine["engine_mode"] == "minibatch":
+        model = MiniBatchKMeans(
+            n_clusters=n_clusters,
+            init=init if init is not None else 'k-means++',
+            batch_size=max(engine["batch_size"] or DEFAULT_MINIBATCH_SIZE, n_clusters),
+            max_iter=engine["max_iter"] or DEFAULT_MINIBATCH_EPOCHS,
+            random_state=42,
+            n_init=1 if init is not None else 3
+        )
+    elif init is not None:
+        model = KMeans(n_clusters=n_clusters, init=init, n_init=1, max_iter=engine["max_iter"] or WARM_START_MAX_ITER)
+    else:
+        model = KMeans(n_clusters=n_clusters, random_state=42, max_iter=engine["max_iter"] or 300)
+    labels = model.fit_predict(X, sample_weight=sample_weight)
+    logger.info(f"{type(model).__name__} stopped after {model.n_iter_} iterations")
+    return labels, model.cluster_centers_, int(model.n_iter_)
+
+def cluster_label_names(n_clusters: int) -> List[str]:
+    """Segment labels from lowest to highest value, for any number of clusters."""
+    if n_clusters == 1:
+        return ['Mid']
+    if n_clusters == 2:
+        return ['Low', 'High']
+    if n_clusters == 3:
+        return ['Low', 'Mid', 'High']
+    return ['Low'] + [f"Mid {i}" for i in range(1, n_clusters - 1)] + ['High']
+
+def _score_k(X: np.ndarray, k: int, engine: Dict[str, Any]) -> Dict[str, Any]:
+    labels, centroids, _ = _fit_clusters(X, k, engine)
+    inertia = float(((X - centroids[labels]) ** 2).sum())
+    silhouette = -1.0
+    if 1 < len(np.unique(labels)) < len(X):
+        silhouette = float(silhouette_score(X, labels, sample_size=min(SILHOUETTE_SAMPLE, len(X)), random_state=42))
+    return {"k": k, "inertia": inertia, "silhouette": silhouette}
+
+def select_n_clusters(X: np.ndarray, engine: Dict[str, Any], k_range: List[int] = None, max_workers: int = None):
+    """
+    Pick the number of clusters by fitting every k in k_range in parallel
+    processes. Fits run on a sample of at most K_SELECTION_SAMPLE customers and
+    silhouettes on at most SILHOUETTE_SAMPLE, so the sweep cost is bounded.
+
+    Returns:
+        Chosen k (best silhouette, smaller k on ties) and the per-k scores, with
+        the inertia elbow for reference
+    """
+    low, high = k_range or DEFAULT_K_RANGE
+    k_values = list(range(max(2, low), min(high, len(X) - 1) + 1))
+    if not k_values:
+        raise ValueError(f"Cannot select n_clusters in {[low, high]} for {len(X)} customers")
+    if len(X) > K_SELECTION_SAMPLE:
+        X = X[np.random.default_rng(42).choice(len(X), K_SELECTION_SAMPLE, replace=False)]
+
+    workers = min(max_workers or os.cpu_count() or 1, len(k_values))
+    scores = map_all(_score_k, [(X, k, engine) for k in k_values], workers)
+
+    best = max(scores, key=lambda score: (score["silhouette"], -score["k"]))
+    # Elbow: largest drop-off in the inertia decrease between consecutive k
+    inertia = np.array([score["inertia"] for score in scores])
+    elbow = k_values[int(np.argmax(np.diff(inertia, 2))) + 1] if len(k_values) >= 3 else best["k"]
+    logger.info(f"Selected n_clusters={best['k']} (silhouette {best['silhouette']:.3f}, elbow at k={elbow})")
+    return best["k"], {"k_range": [k_values[0], k_values[-1]], "elbow": elbow, "selected": best["k"], "scores": scores}
+
+def _stratified_sample(rfm: pd.DataFrame, labels: List[str], max_points: int) -> List[Dict[str, Any]]:
+    """
+    Up to max_points customers sampled per cluster in proportion to cluster
+    size, with at least one point for every non-empty cluster.
+    """
+    sizes = rfm['cluster'].value_counts()
+    total = int(sizes.sum())
+    samples = []
+    for label in labels:
+        size = int(sizes.get(label, 0))
+        if size == 0:
+            continue
+        quota = min(size, max(1, round(max_points * size / total)))
+        members = rfm[rfm['cluster'] == label]
+        samples.append(members.sample(n=quota, random_state=42) if quota < size else members)
+    if not samples:
+        return []
+    return pd.concat(samples)[['recency', 'monetary', 'cluster']].to_dict(orient='records')
+
+def _density_grid(rfm: pd.DataFrame, labels: List[str], bins: int) -> Dict[str, Any]:
+    """
+    2D recency x monetary histogram per cluster, computed with one bincount.
+    Recency bins are linear; monetary bins are log-spaced since spend is
+    heavily skewed. Only non-empty cells are returned, as [recency bin,
+    monetary bin, count] triplets keyed by cluster label.
+    """
+    recency = rfm['recency'].to_numpy(dtype=np.float64)
+    monetary = rfm['monetary'].to_numpy(dtype=np.float64)
+    # int8 category codes would overflow when packed into the cell key below
+    codes = pd.Categorical(rfm['cluster'], categories=labels).codes.astype(np.int64)
+    valid = ~np.isnan(recency) & ~np.isnan(monetary) & (codes >= 0)
+    recency, monetary, codes = recency[valid], monetary[valid], codes[valid]
+    if len(recency) == 0:
+        return {"recency_edges": [], "monetary_edges": [], "monetary_scale": "log", "cells": {}}
+
+    recency_edges = np.linspace(recency.min(), recency.max(), bins + 1)
+    low = max(monetary.min(), 1.0)
+    monetary_edges = np.geomspace(low, max(monetary.max(), low * 1.000001), bins + 1)
+    r_bin = np.clip(np.searchsorted(recency_edges, recency, side='right') - 1, 0, bins - 1)
+    m_bin = np.clip(np.searchsorted(monetary_edges, monetary, side='right') - 1, 0, bins - 1)
+    counts = np.bincount((codes * bins + r_bin) * bins + m_bin, minlength=len(labels) * bins * bins)
+    counts = counts.reshape(len(labels), bins, bins)
+
+    cells = {}
+    for code, label in enumerate(labels):
+        r_idx, m_idx = np.nonzero(counts[code])
+        if len(r_idx):
+            cells[label] = np.column_stack([r_idx, m_idx, counts[code, r_idx, m_idx]]).tolist()
+    return {
+        "recency_edges": recency_edges.round(2).tolist(),
+        "monetary_edges": monetary_edges.round(2).tolist(),
+        "monetary_scale": "log",
+        "cells": cells
+    }
+
 def run_clustering(
-    sales_data: List[Dict[str, Any]] = None,
-    n_clusters: int = 3,
+    sales_data: Union[pd.DataFrame, List[Dict[str, Any]]] = None,
+    n_clusters: Union[int, str] = 3,
     max_graph_customers: int = 50,
     include_reports: bool = True,
     historical_stats: List[Dict[str, Any]] = None,
-    db=None
+    db=None,
+    file_path: str = None,
+    streaming: bool = False,
+    chunksize: int = None,
+    features: List[str] = None,
+    engine_mode: str = "full",
+    batch_size: int = None,
+    max_iter: int = None,
+    warm_start: bool = True,
+    use_cache: bool = True,
+    k_range: List[int] = None,
+    max_workers: int = None,
+    graph_mode: str = "head",
+    density_bins: int = None,
+    persist_assignments: bool = True
 ) -> Dict[str, Any]:
     try:
-        # Load sales data if not provided
+        current_date = pd.to_datetime(datetime.now())
+        features = features or ['recency', 'monetary']
+        unknown_features = [feature for feature in features if feature not in RFM_FEATURES]
+        if unknown_features:
+            raise ValueError(f"Unknown clustering features: {unknown_features}, expected any of {RFM_FEATURES}")
+        if engine_mode not in CLUSTER_ENGINE_MODES:
+            raise ValueError(f"Unknown engine_mode '{engine_mode}', expected one of {CLUSTER_ENGINE_MODES}")
+        if n_clusters != "auto" and (not isinstance(n_clusters, int) or n_clusters < 1):
+            raise ValueError(f"n_clusters must be a positive integer or 'auto', got {n_clusters!r}")
+        if graph_mode not in GRAPH_MODES:
+            raise ValueError(f"Unknown graph_mode '{graph_mode}', expected one of {GRAPH_MODES}")
+        output = {
+            "graph_mode": graph_mode,
+            "density_bins": density_bins or DEFAULT_DENSITY_BINS,
+            "persist_assignments": persist_assignments
+        }
+        engine = {
+            "engine_mode": engine_mode,
+            "batch_size": batch_size,
+            "max_iter": max_iter,
+            "warm_start": warm_start,
+            "k_range": k_range,
+            "max_workers": max_workers
+        }
+
         if sales_data is None:
-            logger.info("No sales data provided, loading from utils")
-            sales_data = load_sales_data().to_dict(orient='records')
-        
-        if not sales_data:
+            # Results for the sales file are cached per data version, day and parameters
+            key = None
+            if use_cache:
+                key = cache_key(
+                    source=source_fingerprint(file_path or SALES_DATA_PATH)["sha256"],
+                    as_of=current_date.strftime("%Y-%m-%d"),
+                    n_clusters=n_clusters,
+                    features=features,
+                    engine=engine,
+                    streaming=streaming,
+                    max_graph_customers=max_graph_customers,
+                    output=output,
+                    include_reports=include_reports,
+                    engine_version=CLUSTER_ENGINE_VERSION
+                )
+                cached = get_cached(key)
+                if cached is not None:
+                    logger.info(f"Returning cached clustering result {key[:12]}")
+                    cached["timestamp"] = datetime.now().strftime("%Y-%m-%d_%H:%M")
+                    cached["cache"] = {"hit": True, "key": key}
+                    return cached
+
+            if streaming:
+                logger.info("No sales data provided, streaming customer aggregates from file")
+                totals = stream_customer_aggregates(file_path, chunksize)
+                rfm = rfm_from_aggregates(
+                    totals['CustomerID'],
+                    to_day_numbers(totals['last_order']),
+                    totals['monetary'],
+                    totals['frequency'],
+                    current_date
+                )
+            else:
+                # Load sales data in the compact schema
+                logger.info("No sales data provided, loading from utils")
+                rfm = build_rfm_features(load_sales_data(file_path, compact=True), current_date)
+            result = _cluster_customers(rfm, n_clusters, max_graph_customers, include_reports, features, engine, db, output)
+            if key is not None:
+                put_cached(key, result)
+                result["cache"] = {"hit": False, "key": key}
+            return result
+
+        # In-process DataFrames (full or compact schema) are used as is; only
+        # inline JSON records are converted
+        df = sales_data if isinstance(sales_data, pd.DataFrame) else pd.DataFrame(sales_data)
+        if df.empty:
             logger.warning("No sales data available")
             return {
                 "task_id": 3,
@@ -38,11 +291,9 @@ def run_clustering(
                 "message": "No sales data available for clustering"
             }
         
-        # Convert to DataFrame
-        df = pd.DataFrame(sales_data)
-        
         # Calculate RFM metrics (simplified for demo)
-        if 'CustomerID' not in df.columns or 'OrderDate' not in df.columns or 'Sales' not in df.columns:
+        has_dates = 'OrderDate' in df.columns or 'OrderDay' in df.columns
+        if 'CustomerID' not in df.columns or not has_dates or 'Sales' not in df.columns:
             logger.error("Required columns missing in sales data")
             return {
                 "task_id": 3,
@@ -56,67 +307,9 @@ def run_clustering(
                 "message": "Required columns missing in sales data"
             }
         
-        # Calculate recency and monetary value
-        current_date = pd.to_datetime(datetime.now())
-        rfm = df.groupby('CustomerID').agg({
-            'OrderDate': lambda x: (current_date - pd.to_datetime(x).max()).days,
-            'Sales': ['sum', 'count']
-        }).reset_index()
-        rfm.columns = ['CustomerID', 'recency', 'monetary', 'frequency']
-        
-        # Apply KMeans clustering
-        X = rfm[['recency', 'monetary']].values
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-        rfm['cluster'] = kmeans.fit_predict(X)
-        
-        # Map cluster numbers to labels (simplified logic)
-        cluster_means = rfm.groupby('cluster')['monetary'].mean().sort_values()
-        cluster_labels = {cluster: label for cluster, label in zip(cluster_means.index, ['Low', 'Mid', 'High'][:n_clusters])}
-        rfm['cluster'] = rfm['cluster'].map(cluster_labels)
-        
-        # Prepare graph_data (limited to max_graph_customers)
-        graph_data = rfm[['recency', 'monetary', 'cluster']].head(max_graph_customers).to_dict(orient='records')
-        
-        # Prepare stats
-        stats = []
-        for cluster_label in ['High', 'Mid', 'Low'][:n_clusters]:
-            cluster_data = rfm[rfm['cluster'] == cluster_label]
-            if not cluster_data.empty:
-                stats.append({
-                    "id": cluster_label.lower(),
-                    "name": f"{cluster_label} Customers",
-                    "count": int(cluster_data.shape[0]),
-                    "value": float(cluster_data['monetary'].sum()),
-                    "totalRevenue": float(cluster_data['monetary'].sum()),
-                    "avgOrderValue": float(cluster_data['monetary'].mean()),
-                    "color": {"High": "#10B981", "Mid": "#14B8A6", "Low": "#06B6D4"}[cluster_label],
-                    "characteristics": ["Technology focused", "Office Supplies focused", "Furniture focused"],
-                    "growth": 0.0
-                })
-        
-        # Prepare reports
-        reports = []
-        if include_reports:
-            for stat in stats:
-                reports.append(
-                    f"{stat['name']}: {stat['count']} customers, ${stat['totalRevenue']:.2f} revenue, "
-                    f"top categories: {', '.join(stat['characteristics'])}."
-                )
-        
-        result = {
-            "task_id": 3,
-            "pipeline_id": "AgentBI-Demo",
-            "schema_version": "v0.6.2",
-            "timestamp": datetime.now().strftime("%Y-%m-%d_%H:%M"),
-            "status": "success",
-            "graph_data": graph_data,
-            "stats": stats,
-            "reports": reports,
-            "message": f"Clustered {len(rfm)} customers into {n_clusters} segments"
-        }
-        
-        logger.info(f"Clustering completed: {len(stats)} clusters generated")
-        return result
+        # Calculate recency, frequency and monetary features
+        rfm = build_rfm_features(df, current_date)
+        return _cluster_customers(rfm, n_clusters, max_graph_customers, include_reports, features, engine, db, output)
     except Exception as e:
         logger.error(f"Clustering failed: {str(e)}", exc_info=True)
         return {
@@ -129,4 +322,137 @@ def run_clustering(
             "stats": [],
             "reports": [],
             "message": f"Clustering failed: {str(e)}"
-        }
\ No newline at end of file
+        }
+
+def _cluster_customers(
+    rfm: pd.DataFrame,
+    n_clusters: int,
+    max_graph_customers: int,
+    include_reports: bool,
+    features: List[str],
+    engine: Dict[str, Any],
+    db=None,
+    output: Dict[str, Any] = None
+) -> Dict[str, Any]:
+    X = rfm[features].to_numpy(dtype=np.float64)
+    pipeline_id = "AgentBI-Demo"
+    k_selection = None
+    if n_clusters == "auto":
+        n_clusters, k_selection = select_n_clusters(X, engine, engine.get("k_range"), engine.get("max_workers"))
+    previous = None
+    warm = False
+    if db is not None and engine.get("warm_start"):
+        previous = load_previous_model(db, pipeline_id, features, n_clusters, engine["engine_mode"])
+        warm = previous is not None
+        if warm and feature_drift(previous, X) > DRIFT_THRESHOLD:
+            logger.info(f"Features drifted since segmentation model {previous['model_id']}, fitting from scratch")
+            warm = False
+
+    if warm:
+        # Warm start: refine the previous centroids from the new or changed
+        # customers only, with each cluster's unchanged customers standing in
+        # as its centroid weighted by their count, then re-assign just the
+        # changed ones. Cluster indices (and labels) stay stable.
+        clusters, changed = changed_customers(previous, rfm)
+        centroids, iterations = previous["centroids"], 0
+        if changed.any():
+            unchanged_sizes = np.bincount(clusters[~changed], minlength=n_clusters).astype(np.float64)
+            points = np.vstack([previous["centroids"], X[changed]])
+            weights = np.concatenate([unchanged_sizes, np.ones(int(changed.sum()))])
+            _, centroids, iterations = _fit_clusters(points, n_clusters, engine, init=previous["centroids"], sample_weight=weights)
+            clusters[changed] = pairwise_distances_argmin(X[changed], centroids)
+        label_map = previous["label_map"]
+        reassigned = int(changed.sum())
+        logger.info(f"Warm started from segmentation model {previous['model_id']}, re-assigned {reassigned} customers")
+    else:
+        # Apply KMeans clustering
+        clusters, centroids, iterations = _fit_clusters(X, n_clusters, engine)
+        reassigned = len(rfm)
+
+        # Map cluster numbers to labels (simplified logic)
+        cluster_means = pd.Series(rfm['monetary'].to_numpy()).groupby(clusters).mean().sort_values()
+        label_map = [None] * n_clusters
+        for cluster, label in zip(cluster_means.index, cluster_label_names(n_clusters)):
+            label_map[cluster] = label
+
+    model = {
+        "warm_started": warm,
+        "iterations": iterations,
+        "reassigned_customers": reassigned,
+        "model_id": None
+    }
+    if db is not None:
+        try:
+            model["model_id"] = save_model(
+                db, pipeline_id, features, n_clusters, centroids, X, clusters, label_map, rfm, engine["engine_mode"],
+                previous_model_id=previous["model_id"] if previous is not None else None
+            )
+        except Exception as e:
+            logger.warning(f"Failed to persist segmentation model: {str(e)}")
+    rfm['cluster'] = pd.Series(clusters, index=rfm.index).map(dict(enumerate(label_map)))
+
+    # Keep every customer's assignment for CRM lookups
+    run_id = uuid.uuid4().hex
+    assignments_saved = 0
+    if db is not None and (output or {}).get("persist_assignments", True):
+        try:
+            assignments_saved = save_customer_segments(db, rfm, run_id, pipeline_id)
+        except Exception as e:
+            logger.warning(f"Failed to persist customer segment assignments: {str(e)}")
+    
+    # Prepare graph_data (limited to max_graph_customers)
+    graph_density = None
+    if output and output["graph_mode"] == "density":
+        labels = cluster_label_names(n_clusters)
+        graph_data = _stratified_sample(rfm, labels, max_graph_customers)
+        graph_density = _density_grid(rfm, labels, output["density_bins"])
+    else:
+        graph_data = rfm[['recency', 'monetary', 'cluster']].head(max_graph_customers).to_dict(orient='records')
+    
+    # Prepare stats
+    stats = []
+    for cluster_label in reversed(cluster_label_names(n_clusters)):
+        cluster_data = rfm[rfm['cluster'] == cluster_label]
+        if not cluster_data.empty:
+            stats.append({
+                "id": cluster_label.lower().replace(" ", "-"),
+                "name": f"{cluster_label} Customers",
+                "count": int(cluster_data.shape[0]),
+                "value": float(cluster_data['monetary'].sum()),
+                "totalRevenue": float(cluster_data['monetary'].sum()),
+                "avgOrderValue": float(cluster_data['monetary'].mean()),
+                "color": CLUSTER_COLORS[cluster_label.split()[0]],
+                "characteristics": ["Technology focused", "Office Supplies focused", "Furniture focused"],
+                "growth": 0.0
+            })
+    
+    # Prepare reports
+    reports = []
+    if include_reports:
+        for stat in stats:
+            reports.append(
+                f"{stat['name']}: {stat['count']} customers, ${stat['totalRevenue']:.2f} revenue, "
+                f"top categories: {', '.join(stat['characteristics'])}."
+            )
+    
+    result = {
+        "task_id": 3,
+        "pipeline_id": "AgentBI-Demo",
+        "schema_version": "v0.6.2",
+        "timestamp": datetime.now().strftime("%Y-%m-%d_%H:%M"),
+        "status": "success",
+        "graph_data": graph_data,
+        "graph_density": graph_density,
+        "stats": stats,
+        "reports": reports,
+        "engine_mode": engine["engine_mode"],
+        "model": model,
+        "run_id": run_id,
+        "assignments_saved": assignments_saved,
+        "n_clusters": n_clusters,
+        "k_selection": k_selection,
+        "message": f"Clustered {len(rfm)} customers into {n_clusters} segments"
+    }
+    
+    logger.info(f"Clustering completed: {len(stats)} clusters generated")
+    return result
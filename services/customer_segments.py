@@ -0,0 +1,50 @@
+import logging
+from typing import Dict, Any, List
+from datetime import datetime
+import pandas as pd
+from pymongo import ASCENDING, DESCENDING
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SEGMENT_COLLECTION = "customer_segments"
+SEGMENT_BATCH_SIZE = 10_000
+SEGMENT_FIELDS = ['CustomerID', 'cluster', 'recency', 'monetary', 'frequency', 'r_score', 'f_score', 'm_score', 'rfm_score']
+
+def ensure_segment_indexes(db) -> None:
+    db[SEGMENT_COLLECTION].create_index([("pipeline_id", ASCENDING), ("CustomerID", ASCENDING), ("created_at", DESCENDING)])
+    db[SEGMENT_COLLECTION].create_index([("pipeline_id", ASCENDING), ("run_id", ASCENDING)])
+
+def save_customer_segments(db, rfm: pd.DataFrame, run_id: str, pipeline_id: str = "AgentBI-Demo") -> int:
+    """
+    Write every customer's segment and RFM values for one clustering run with
+    batched unordered insert_many, then drop the pipeline's older runs. The
+    new run is fully written before the old one goes, so lookups never miss.
+    """
+    ensure_segment_indexes(db)
+    created_at = datetime.now()
+    columns = [col for col in SEGMENT_FIELDS if col in rfm.columns]
+    frame = rfm[columns].assign(CustomerID=rfm['CustomerID'].astype(str))
+    written = 0
+    for start in range(0, len(frame), SEGMENT_BATCH_SIZE):
+        docs = frame.iloc[start:start + SEGMENT_BATCH_SIZE].to_dict(orient="records")
+        for doc in docs:
+            doc["run_id"] = run_id
+            doc["pipeline_id"] = pipeline_id
+            doc["created_at"] = created_at
+        db[SEGMENT_COLLECTION].insert_many(docs, ordered=False)
+        written += len(docs)
+    db[SEGMENT_COLLECTION].delete_many({"pipeline_id": pipeline_id, "run_id": {"$ne": run_id}})
+    logger.info(f"Saved {written} customer segment assignments for run {run_id}")
+    return written
+
+def get_customer_segments(db, customer_ids: List[str], pipeline_id: str = "AgentBI-Demo") -> Dict[str, Dict[str, Any]]:
+    """Latest segment assignment per requested customer, keyed by CustomerID."""
+    cursor = db[SEGMENT_COLLECTION].find(
+        {"pipeline_id": pipeline_id, "CustomerID": {"$in": list(customer_ids)}},
+        {"_id": 0}
+    ).sort("created_at", DESCENDING)
+    segments = {}
+    for doc in cursor:
+        segments.setdefault(doc["CustomerID"], doc)
+    return segments
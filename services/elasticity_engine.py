@@ -0,0 +1,295 @@
+import os
+import logging
+from typing import Dict, Any, List
+import numpy as np
+import pandas as pd
+from services.worker_pool import map_all
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ELASTICITY_COLUMNS = ['Product ID', 'Category', 'Sub-Category', 'Sales', 'Quantity', 'Profit']
+MIN_OBSERVATIONS = 5
+# Recommended prices stay within these multiples of the current average price
+PRICE_ADJUSTMENT_BOUNDS = (0.8, 1.2)
+DEFAULT_GRID_STEPS = 41
+
+def _group_codes(values: pd.Series):
+    """Integer code per row and the group key per code (categorical codes when available)."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy().astype(np.int64), values.cat.categories
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes.astype(np.int64), uniques
+
+def fit_grouped_log_log(codes: np.ndarray, n_groups: int, log_price: np.ndarray, log_quantity: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Fit log(quantity) = a + e * log(price) for every group at once.
+
+    The per-group normal equations only need group sums, so all regressions
+    are solved together from a handful of bincounts over centered values
+    instead of one least-squares call per group.
+
+    Returns:
+        Arrays per group: n, elasticity, intercept, r2 and the elasticity's
+        standard error (NaN where a group has too few points or no price variation)
+    """
+    n = np.bincount(codes, minlength=n_groups).astype(np.float64)
+    safe_n = np.where(n > 0, n, 1.0)
+    mean_x = np.bincount(codes, weights=log_price, minlength=n_groups) / safe_n
+    mean_y = np.bincount(codes, weights=log_quantity, minlength=n_groups) / safe_n
+    dx = log_price - mean_x[codes]
+    dy = log_quantity - mean_y[codes]
+    sxx = np.bincount(codes, weights=dx * dx, minlength=n_groups)
+    sxy = np.bincount(codes, weights=dx * dy, minlength=n_groups)
+    syy = np.bincount(codes, weights=dy * dy, minlength=n_groups)
+
+    identified = (n >= 3) & (sxx > 1e-12)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(identified, sxy / sxx, np.nan)
+        sse = np.clip(syy - slope * sxy, 0, None)
+        r2 = np.where(identified & (syy > 0), 1 - sse / syy, np.nan)
+        stderr = np.where(identified, np.sqrt(sse / np.maximum(n - 2, 1) / sxx), np.nan)
+    return {
+        "n": n.astype(np.int64),
+        "elasticity": slope,
+        "intercept": mean_y - np.nan_to_num(slope) * mean_x,
+        "r2": r2,
+        "stderr": stderr
+    }
+
+def estimate_elasticities(df: pd.DataFrame, min_observations: int = MIN_OBSERVATIONS) -> pd.DataFrame:
+    """
+    Price elasticity of demand per Product ID from order lines, with the
+    Sub-Category elasticity as fallback for products with fewer than
+    min_observations lines or no price variation. The price of a line is
+    Sales / Quantity, so discounts are what moves it.
+
+    Returns:
+        One row per product with Category, Sub-Category, observations,
+        elasticity (and its source), r2, average price, unit cost and quantity
+    """
+    missing = [col for col in ELASTICITY_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns for elasticity estimation: {missing}")
+
+    sales = df['Sales'].to_numpy(dtype=np.float64)
+    quantity = df['Quantity'].to_numpy(dtype=np.float64)
+    profit = df['Profit'].to_numpy(dtype=np.float64)
+    product_codes, products = _group_codes(df['Product ID'])
+    sub_category_codes, sub_categories = _group_codes(df['Sub-Category'])
+    category_codes, categories = _group_codes(df['Category'])
+
+    valid = (sales > 0) & (quantity > 0) & (product_codes >= 0) & (sub_category_codes >= 0) & ~np.isnan(profit)
+    sales, quantity, profit = sales[valid], quantity[valid], profit[valid]
+    product_codes, sub_category_codes, category_codes = product_codes[valid], sub_category_codes[valid], category_codes[valid]
+    log_price = np.log(sales / quantity)
+    log_quantity = np.log(quantity)
+
+    by_product = fit_grouped_log_log(product_codes, len(products), log_price, log_quantity)
+    by_sub_category = fit_grouped_log_log(sub_category_codes, len(sub_categories), log_price, log_quantity)
+
+    # Each product's sub-category and category, from its first order line
+    present, first_row = np.unique(product_codes, return_index=True)
+    product_sub_category = sub_category_codes[first_row]
+    product_category = category_codes[first_row]
+
+    own = by_product["elasticity"][present]
+    fallback = by_sub_category["elasticity"][product_sub_category]
+    use_own = (by_product["n"][present] >= min_observations) & ~np.isnan(own)
+
+    units = np.bincount(product_codes, weights=quantity, minlength=len(products))[present]
+    revenue = np.bincount(product_codes, weights=sales, minlength=len(products))[present]
+    cost = revenue - np.bincount(product_codes, weights=profit, minlength=len(products))[present]
+    estimates = pd.DataFrame({
+        'Product ID': np.asarray(products)[present],
+        'Category': pd.Categorical.from_codes(product_category, categories=categories),
+        'Sub-Category': pd.Categorical.from_codes(product_sub_category, categories=sub_categories),
+        'observations': by_product["n"][present],
+        'elasticity': np.where(use_own, own, fallback),
+        'elasticity_source': np.where(use_own, 'product', 'sub_category'),
+        'r2': np.where(use_own, by_product["r2"][present], by_sub_category["r2"][product_sub_category]),
+        'stderr': np.where(use_own, by_product["stderr"][present], by_sub_category["stderr"][product_sub_category]),
+        'avg_price': revenue / units,
+        'unit_cost': cost / units,
+        'units': units
+    })
+    logger.info(
+        f"Estimated elasticities for {len(estimates)} products from {len(sales)} order lines "
+        f"({int(use_own.sum())} product-level, {int((~use_own).sum())} from sub-category)"
+    )
+    return estimates
+
+def recommend_prices(estimates: pd.DataFrame, bounds=PRICE_ADJUSTMENT_BOUNDS) -> pd.DataFrame:
+    """
+    Profit-maximizing price multiplier per product under constant-elasticity
+    demand: p* = c * e / (1 + e) when demand is elastic (e < -1). Inelastic or
+    unestimated products are pushed to the upper or kept at 1.0 respectively.
+    Multipliers are clipped to bounds and the expected profit change is
+    evaluated at the clipped price.
+    """
+    low, high = bounds
+    elasticity = estimates['elasticity'].to_numpy(dtype=np.float64)
+    price = estimates['avg_price'].to_numpy(dtype=np.float64)
+    cost = estimates['unit_cost'].to_numpy(dtype=np.float64)
+    units = estimates['units'].to_numpy(dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        optimal = np.where(elasticity < -1, cost * elasticity / (1 + elasticity) / price, high)
+    multiplier = np.where(np.isnan(elasticity), 1.0, np.clip(np.nan_to_num(optimal, nan=1.0), low, high))
+    e = np.nan_to_num(elasticity)
+    current_profit = (price - cost) * units
+    expected_profit = (price * multiplier - cost) * units * multiplier ** e
+
+    recommendations = estimates.assign(
+        price_adjustment=multiplier,
+        recommended_price=price * multiplier,
+        expected_profit_change=expected_profit - current_profit
+    )
+    return recommendations.sort_values('expected_profit_change', ascending=False, kind='stable')
+
+def summarize_sub_categories(recommendations: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Unit-weighted elasticity and total expected profit change per Sub-Category."""
+    grouped = recommendations.assign(weighted=recommendations['elasticity'] * recommendations['units']).groupby(
+        'Sub-Category', observed=True, sort=True
+    ).agg(
+        products=('Product ID', 'count'),
+        units=('units', 'sum'),
+        weighted=('weighted', 'sum'),
+        expected_profit_change=('expected_profit_change', 'sum')
+    )
+    return [
+        {
+            "sub_category": str(sub_category),
+            "products": int(row.products),
+            "elasticity": float(row.weighted / row.units) if row.units else None,
+            "expected_profit_change": float(row.expected_profit_change)
+        }
+        for sub_category, row in grouped.iterrows()
+    ]
+
+def profit_surface(price: np.ndarray, cost: np.ndarray, units: np.ndarray, elasticity: np.ndarray, multipliers: np.ndarray) -> np.ndarray:
+    """
+    Expected profit for every row at every candidate price multiplier, as one
+    broadcasted (rows x candidates) array under constant-elasticity demand.
+    """
+    m = multipliers[None, :]
+    return (price[:, None] * m - cost[:, None]) * units[:, None] * m ** elasticity[:, None]
+
+def _search_partition(
+    products: np.ndarray,
+    segments: np.ndarray,
+    price: np.ndarray,
+    cost: np.ndarray,
+    units: np.ndarray,
+    elasticity: np.ndarray,
+    multipliers: np.ndarray,
+    n_segments: int
+) -> Dict[str, np.ndarray]:
+    """
+    Process pool worker for one Category: profit surface of its product x
+    segment cells (sorted by product), reduced to the best multiplier per
+    product and to a summed surface per segment.
+    """
+    surface = profit_surface(price, cost, units, elasticity, multipliers)
+    starts = np.flatnonzero(np.r_[True, products[1:] != products[:-1]])
+    product_surface = np.add.reduceat(surface, starts, axis=0)
+    segment_surface = np.zeros((n_segments, len(multipliers)))
+    np.add.at(segment_surface, segments, surface)
+    best = product_surface.argmax(axis=1)
+    current = (price - cost) * units
+    return {
+        "products": products[starts],
+        "best_multiplier": multipliers[best],
+        "best_profit": product_surface[np.arange(len(starts)), best],
+        "current_profit": np.add.reduceat(current, starts),
+        "segment_surface": segment_surface
+    }
+
+def grid_search_prices(
+    df: pd.DataFrame,
+    estimates: pd.DataFrame,
+    multipliers: np.ndarray,
+    max_workers: int = None
+):
+    """
+    Evaluate every candidate price multiplier for every product at once and
+    pick the profit-maximizing one per product and per customer Segment.
+
+    Order lines are rolled up to product x Segment cells (units, price and
+    unit cost per cell) with bincounts, and each Category's cells are searched
+    in its own worker process. Products without an elasticity estimate keep
+    their current price.
+
+    Returns:
+        Per-product frame (estimates plus price_adjustment, recommended_price
+        and expected_profit_change) and a per-segment list of optima
+    """
+    product_codes, products = _group_codes(df['Product ID'])
+    if 'Segment' in df.columns:
+        segment_codes, segments = _group_codes(df['Segment'])
+    else:
+        segment_codes, segments = np.zeros(len(df), dtype=np.int64), pd.Index(['All'])
+    sales = df['Sales'].to_numpy(dtype=np.float64)
+    quantity = df['Quantity'].to_numpy(dtype=np.float64)
+    profit = df['Profit'].to_numpy(dtype=np.float64)
+    valid = (sales > 0) & (quantity > 0) & (product_codes >= 0) & (segment_codes >= 0) & ~np.isnan(profit)
+    product_codes, segment_codes = product_codes[valid], segment_codes[valid]
+    sales, quantity, profit = sales[valid], quantity[valid], profit[valid]
+
+    # Product x Segment cells, sorted by product
+    n_segments = len(segments)
+    cells, inverse = np.unique(product_codes * n_segments + segment_codes, return_inverse=True)
+    cell_units = np.bincount(inverse, weights=quantity)
+    cell_revenue = np.bincount(inverse, weights=sales)
+    cell_cost = cell_revenue - np.bincount(inverse, weights=profit)
+    cell_products = cells // n_segments
+    cell_segments = cells % n_segments
+
+    estimate_index = pd.Index(estimates['Product ID'].astype(str)).get_indexer(np.asarray(products)[cell_products].astype(str))
+    # Products missing from estimates (e.g. no Sub-Category) get -1 and keep their price
+    found = estimate_index >= 0
+    elasticity = np.full(len(cells), np.nan)
+    elasticity[found] = estimates['elasticity'].to_numpy(dtype=np.float64)[estimate_index[found]]
+    category = np.full(len(cells), '', dtype=object)
+    category[found] = np.asarray(estimates['Category'].astype(str))[estimate_index[found]]
+    estimated = found & ~np.isnan(elasticity)
+
+    partitions = [np.flatnonzero((category == name) & estimated) for name in np.unique(category[estimated])]
+    arguments = [
+        (
+            cell_products[rows], cell_segments[rows], cell_revenue[rows] / cell_units[rows],
+            cell_cost[rows] / cell_units[rows], cell_units[rows], elasticity[rows], multipliers, n_segments
+        )
+        for rows in partitions
+    ]
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(arguments)))
+    results = map_all(_search_partition, arguments, workers)
+
+    best = pd.DataFrame({
+        'code': np.concatenate([r["products"] for r in results]) if results else np.zeros(0, dtype=np.int64),
+        'price_adjustment': np.concatenate([r["best_multiplier"] for r in results]) if results else [],
+        'expected_profit_change': np.concatenate([r["best_profit"] - r["current_profit"] for r in results]) if results else []
+    })
+    best['Product ID'] = np.asarray(products)[best['code'].to_numpy(dtype=np.int64)].astype(str)
+    recommendations = estimates.assign(**{'Product ID': estimates['Product ID'].astype(str)}).merge(
+        best.drop(columns='code'), on='Product ID', how='left'
+    )
+    recommendations['price_adjustment'] = recommendations['price_adjustment'].fillna(1.0)
+    recommendations['expected_profit_change'] = recommendations['expected_profit_change'].fillna(0.0)
+    recommendations['recommended_price'] = recommendations['avg_price'] * recommendations['price_adjustment']
+
+    segment_surface = sum(r["segment_surface"] for r in results) if results else np.zeros((n_segments, len(multipliers)))
+    current_profit = np.bincount(
+        cell_segments[estimated], weights=(cell_revenue - cell_cost)[estimated], minlength=n_segments
+    )
+    segment_optima = []
+    for code, name in enumerate(segments):
+        best_point = int(segment_surface[code].argmax())
+        segment_optima.append({
+            "segment": str(name),
+            "price_adjustment": float(multipliers[best_point]),
+            "expected_profit": float(segment_surface[code, best_point]),
+            "expected_profit_change": float(segment_surface[code, best_point] - current_profit[code])
+        })
+    logger.info(f"Searched {len(multipliers)} candidate prices for {len(best)} products in {len(arguments)} category partitions")
+    return recommendations.sort_values('expected_profit_change', ascending=False, kind='stable'), segment_optima
@@ -77,7 +77,8 @@ def send_emails(clusters, reports, price_optimization_data=None, segmentation_st
         total_revenue = cluster_stat.get('value', 0.0)
         top_categories = cluster_stat.get('characteristics', [])
         price_optimization = price_optimization_data.get("llm_report", "No price optimization data available.") if price_optimization_data else ""
-        template = templates.get(cluster_label, templates["low"])
+        # Extra middle segments ("mid-1", "mid-2", ...) share the mid template
+        template = templates.get(cluster_label.split("-")[0], templates["low"])
         template["recipients"] = customer_count
         email_content = template["content"].format(
             report=report,
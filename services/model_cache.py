@@ -0,0 +1,129 @@
+import os
+import copy
+import json
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from services.snapshot_cache import CACHE_DIR
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MODEL_CACHE_DIR = os.path.join(CACHE_DIR, "models")
+# Entry limit of both the in-memory LRU and the on-disk store
+MODEL_CACHE_CAPACITY = int(os.getenv("AGENTBI_MODEL_CACHE_CAPACITY", "32"))
+
+# In-memory LRU over fitted results: {key: value}, most recently used last
+_entries: "OrderedDict[str, Any]" = OrderedDict()
+_lock = threading.Lock()
+_counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+
+def cache_key(**parts) -> str:
+    """Stable key from JSON-serializable parts (fingerprint, parameters, engine version)."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _disk_path(key: str) -> str:
+    return os.path.join(MODEL_CACHE_DIR, f"{key}.pkl")
+
+def _touch(path: str) -> None:
+    """Mark a stored entry as recently used; the disk store is pruned by mtime."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def _prune_disk() -> None:
+    """
+    Keep at most MODEL_CACHE_CAPACITY entries on disk, deleting the least
+    recently used. The store is shared by every process, so recency comes from
+    file mtimes rather than from this process's in-memory LRU.
+    """
+    entries = []
+    try:
+        for entry in os.scandir(MODEL_CACHE_DIR):
+            if entry.name.endswith(".pkl"):
+                try:
+                    entries.append((entry.stat().st_mtime_ns, entry.path))
+                except OSError:
+                    continue
+    except OSError:
+        return
+    entries.sort()
+    for _, path in entries[:max(0, len(entries) - MODEL_CACHE_CAPACITY)]:
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        with _lock:
+            _counters["disk_evictions"] += 1
+
+def _remember(key: str, value: Any) -> None:
+    _entries[key] = value
+    _entries.move_to_end(key)
+    while len(_entries) > MODEL_CACHE_CAPACITY:
+        _entries.popitem(last=False)
+        _counters["evictions"] += 1
+
+def get_cached(key: str) -> Optional[Any]:
+    """
+    Look a key up in memory, then on disk. Returns a copy of the cached value,
+    or None on a miss. Disk hits are promoted into the in-memory LRU.
+    """
+    value = None
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+            _counters["hits"] += 1
+            value = copy.deepcopy(_entries[key])
+    if value is not None:
+        _touch(_disk_path(key))
+        return value
+
+    path = _disk_path(key)
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            _touch(path)
+        except Exception as e:
+            logger.warning(f"Failed to read cached model {path}: {str(e)}")
+
+    with _lock:
+        if value is None:
+            _counters["misses"] += 1
+            return None
+        _counters["disk_hits"] += 1
+        _remember(key, value)
+    return copy.deepcopy(value)
+
+def put_cached(key: str, value: Any) -> None:
+    """Store a value in memory and persist it to the bounded on-disk store."""
+    value = copy.deepcopy(value)
+    with _lock:
+        _remember(key, value)
+    try:
+        os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+        path = _disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"Failed to persist cached model {key}: {str(e)}")
+        return
+    _prune_disk()
+
+def cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters and current size of the in-memory cache."""
+    with _lock:
+        lookups = _counters["hits"] + _counters["disk_hits"] + _counters["misses"]
+        return {
+            **_counters,
+            "size": len(_entries),
+            "capacity": MODEL_CACHE_CAPACITY,
+            "hit_rate": (_counters["hits"] + _counters["disk_hits"]) / lookups if lookups else 0.0
+        }
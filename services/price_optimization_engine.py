@@ -2,12 +2,111 @@
 import logging
 from typing import List, Dict, Any
 from datetime import datetime
+import numpy as np
+import pandas as pd
+from services.utils import load_sales_data
+from services.elasticity_engine import (
+    estimate_elasticities, recommend_prices, grid_search_prices, summarize_sub_categories,
+    MIN_OBSERVATIONS, PRICE_ADJUSTMENT_BOUNDS, DEFAULT_GRID_STEPS
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def optimize_prices(segmentation_stats: List[Dict[str, Any]] = None, db=None) -> Dict[str, Any]:
+PRICING_MODES = ["segment", "elasticity", "grid"]
+
+def _elasticity_recommendations(
+    mode: str,
+    sales_data=None,
+    file_path: str = None,
+    min_observations: int = MIN_OBSERVATIONS,
+    max_recommendations: int = None,
+    price_grid: List[float] = None,
+    max_workers: int = None
+) -> Dict[str, Any]:
+    if sales_data is None:
+        df = load_sales_data(file_path, compact=True)
+    else:
+        df = sales_data if isinstance(sales_data, pd.DataFrame) else pd.DataFrame(sales_data)
+    estimates = estimate_elasticities(df, min_observations)
+    segment_recommendations = None
+    if mode == "grid":
+        low, high, steps = price_grid or [*PRICE_ADJUSTMENT_BOUNDS, DEFAULT_GRID_STEPS]
+        multipliers = np.linspace(low, high, int(steps))
+        recommendations, segment_recommendations = grid_search_prices(df, estimates, multipliers, max_workers)
+    else:
+        recommendations = recommend_prices(estimates)
+    sub_categories = summarize_sub_categories(recommendations)
+    if max_recommendations:
+        recommendations = recommendations.head(max_recommendations)
+
+    columns = {
+        'Product ID': 'product_id',
+        'Category': 'category',
+        'Sub-Category': 'sub_category',
+        'observations': 'observations',
+        'elasticity': 'elasticity',
+        'elasticity_source': 'elasticity_source',
+        'r2': 'r2',
+        'avg_price': 'current_price',
+        'recommended_price': 'recommended_price',
+        'price_adjustment': 'price_adjustment',
+        'expected_profit_change': 'expected_profit_change'
+    }
+    frame = recommendations[list(columns)].rename(columns=columns)
+    # NaN is not valid JSON; unestimated values become null
+    records = frame.astype(object).where(frame.notna(), None).to_dict(orient="records")
+    for record in records:
+        adjustment = record["price_adjustment"]
+        if adjustment > 1.0:
+            record["strategy"] = f"Increase price by {(adjustment - 1) * 100:.1f}%"
+        elif adjustment < 1.0:
+            record["strategy"] = f"Decrease price by {(1 - adjustment) * 100:.1f}%"
+        else:
+            record["strategy"] = "Maintain current pricing"
+    return {
+        "task_id": 5,
+        "pipeline_id": "AgentBI-Demo",
+        "schema_version": "v0.6.2",
+        "timestamp": datetime.now().strftime("%Y-%m-%d_%H:%M"),
+        "status": "success",
+        "mode": mode,
+        "pricing_recommendations": records,
+        "segment_recommendations": segment_recommendations,
+        "sub_category_elasticities": sub_categories,
+        "expected_profit_change": float(np.nansum(recommendations['expected_profit_change'])),
+        "message": f"Generated {len(records)} {mode}-based pricing recommendations"
+    }
+
+def optimize_prices(
+    segmentation_stats: List[Dict[str, Any]] = None,
+    db=None,
+    mode: str = "segment",
+    sales_data=None,
+    file_path: str = None,
+    min_observations: int = MIN_OBSERVATIONS,
+    max_recommendations: int = None,
+    price_grid: List[float] = None,
+    max_workers: int = None
+) -> Dict[str, Any]:
+    """
+    Price recommendations. mode="segment" applies the fixed per-segment rule;
+    mode="elasticity" estimates price elasticity per product from the sales
+    data and recommends a profit-maximizing price for every product;
+    mode="grid" searches a grid of candidate price multipliers
+    ([low, high, steps], default 0.8-1.2 in 41 steps) per product and per
+    customer Segment, one Category per worker process.
+    """
     try:
+        if mode not in PRICING_MODES:
+            raise ValueError(f"Unknown pricing mode '{mode}', expected one of {PRICING_MODES}")
+        if mode in ("elasticity", "grid"):
+            result = _elasticity_recommendations(
+                mode, sales_data, file_path, min_observations, max_recommendations, price_grid, max_workers
+            )
+            logger.info(f"Price optimization completed: {len(result['pricing_recommendations'])} recommendations generated")
+            return result
+
         if segmentation_stats is None or not segmentation_stats:
             logger.warning("No segmentation stats provided for price optimization")
             result = {
@@ -0,0 +1,192 @@
+import logging
+from typing import Dict, Any, List
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from services.utils import load_sales_data
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROMOTION_DIMENSIONS = ['Category', 'Sub-Category', 'Region']
+# Upper edges of the discount bins after the "no discount" bin: (0, 10%], (10%, 20%], ...
+DISCOUNT_BIN_EDGES = [0.1, 0.2, 0.3, 0.5, 1.0]
+
+def _discount_bin_labels(edges: List[float]) -> List[str]:
+    lower = [0.0] + edges[:-1]
+    return ["0%"] + [f"{low * 100:g}-{high * 100:g}%" for low, high in zip(lower, edges)]
+
+def _cell_codes(df: pd.DataFrame, dimensions: List[str]):
+    """Pack the dimension codes of every row into one cell id, like the rollup cube."""
+    key = np.zeros(len(df), dtype=np.int64)
+    valid = np.ones(len(df), dtype=bool)
+    categories = []
+    for dim in dimensions:
+        column = df[dim] if isinstance(df[dim].dtype, pd.CategoricalDtype) else df[dim].astype('category')
+        codes = column.cat.codes.to_numpy().astype(np.int64)
+        valid &= codes >= 0
+        key = key * len(column.cat.categories) + codes
+        categories.append(column.cat.categories)
+    return key, valid, categories
+
+def _correlation(n, sxx, syy, sxy, sx, sy):
+    """Pearson correlation from (shifted) moment sums; NaN without variance."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx * sx / n
+        var_y = syy - sy * sy / n
+        corr = cov / np.sqrt(var_x * var_y)
+    return np.where((n > 1) & (var_x > 1e-12) & (var_y > 1e-12), corr, np.nan)
+
+def promotion_correlations(
+    df: pd.DataFrame,
+    dimensions: List[str] = None,
+    bin_edges: List[float] = None
+) -> List[Dict[str, Any]]:
+    """
+    Discount response for every Category x Sub-Category x Region cell.
+
+    All statistics come from one grouped pass: rows are mapped to a packed
+    cell id and moment sums (n, sums, squares and cross products of discount,
+    sales and profit, shifted by the global means for numerical stability) are
+    accumulated per cell with bincount. Lift and the binned response curve use
+    the same bincounts keyed by cell x discount bin.
+
+    Returns:
+        One entry per non-empty cell with discount-vs-sales and -profit
+        correlations, the sales/profit lift of discounted over full-price
+        lines, and the response curve per discount bin
+    """
+    dimensions = dimensions or PROMOTION_DIMENSIONS
+    bin_edges = bin_edges or DISCOUNT_BIN_EDGES
+    required = dimensions + ['Discount', 'Sales', 'Profit']
+    missing = [col for col in required if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns for promotion analysis: {missing}")
+
+    key, valid, categories = _cell_codes(df, dimensions)
+    # Compact frames hold float32 discounts; round so 0.1 lands in the (0, 10%] bin
+    discount = np.round(df['Discount'].to_numpy(dtype=np.float64), 6)
+    sales = df['Sales'].to_numpy(dtype=np.float64)
+    profit = df['Profit'].to_numpy(dtype=np.float64)
+    valid &= ~(np.isnan(discount) | np.isnan(sales) | np.isnan(profit))
+    key, discount, sales, profit = key[valid], discount[valid], sales[valid], profit[valid]
+    if len(key) == 0:
+        return []
+
+    cells, cell = np.unique(key, return_inverse=True)
+    n_cells = len(cells)
+    d = discount - discount.mean()
+    s = sales - sales.mean()
+    p = profit - profit.mean()
+    sums = {
+        name: np.bincount(cell, weights=values, minlength=n_cells)
+        for name, values in {
+            "d": d, "s": s, "p": p, "dd": d * d, "ss": s * s, "pp": p * p, "ds": d * s, "dp": d * p,
+            "discount": discount
+        }.items()
+    }
+    n = np.bincount(cell, minlength=n_cells).astype(np.float64)
+    corr_sales = _correlation(n, sums["dd"], sums["ss"], sums["ds"], sums["d"], sums["s"])
+    corr_profit = _correlation(n, sums["dd"], sums["pp"], sums["dp"], sums["d"], sums["p"])
+
+    # Discount bins: 0 for full price, then one per edge
+    n_bins = len(bin_edges) + 1
+    bins = np.where(discount <= 0, 0, np.minimum(np.searchsorted(bin_edges, discount, side='left') + 1, n_bins - 1))
+    cell_bin = cell * n_bins + bins
+    bin_n = np.bincount(cell_bin, minlength=n_cells * n_bins).reshape(n_cells, n_bins)
+    bin_sales = np.bincount(cell_bin, weights=sales, minlength=n_cells * n_bins).reshape(n_cells, n_bins)
+    bin_profit = np.bincount(cell_bin, weights=profit, minlength=n_cells * n_bins).reshape(n_cells, n_bins)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_sales = bin_sales / bin_n
+        avg_profit = bin_profit / bin_n
+        full_price_n = bin_n[:, 0]
+        promo_n = bin_n[:, 1:].sum(axis=1)
+        promo_sales = bin_sales[:, 1:].sum(axis=1) / promo_n
+        promo_profit = bin_profit[:, 1:].sum(axis=1) / promo_n
+        lift_sales = promo_sales / avg_sales[:, 0] - 1
+        lift_profit = (promo_profit - avg_profit[:, 0]) / np.abs(avg_profit[:, 0])
+    has_both = (full_price_n > 0) & (promo_n > 0)
+
+    # Unpack the cell ids back into dimension values
+    labels = {}
+    remainder = cells
+    for dim, dim_categories in reversed(list(zip(dimensions, categories))):
+        labels[dim] = np.asarray(dim_categories)[remainder % len(dim_categories)]
+        remainder = remainder // len(dim_categories)
+
+    def _value(x):
+        return None if not np.isfinite(x) else float(x)
+
+    bin_labels = _discount_bin_labels(bin_edges)
+    matrix = []
+    for i in range(n_cells):
+        matrix.append({
+            **{dim.lower().replace("-", "_"): str(labels[dim][i]) for dim in dimensions},
+            "orders": int(n[i]),
+            "avg_discount": float(sums["discount"][i] / n[i]),
+            "corr_discount_sales": _value(corr_sales[i]),
+            "corr_discount_profit": _value(corr_profit[i]),
+            "lift_sales": _value(lift_sales[i]) if has_both[i] else None,
+            "lift_profit": _value(lift_profit[i]) if has_both[i] else None,
+            "response": [
+                {
+                    "discount_bin": bin_labels[b],
+                    "orders": int(bin_n[i, b]),
+                    "avg_sales": _value(avg_sales[i, b]),
+                    "avg_profit": _value(avg_profit[i, b])
+                }
+                for b in range(n_bins) if bin_n[i, b] > 0
+            ]
+        })
+    return matrix
+
+def analyze_promotions(
+    sales_data=None,
+    file_path: str = None,
+    db=None,
+    dimensions: List[str] = None,
+    bin_edges: List[float] = None
+) -> Dict[str, Any]:
+    """
+    Promotion-sales correlation matrix for the dashboard heatmap.
+
+    Args:
+        sales_data: In-process DataFrame or inline JSON records, defaults to the sales file
+        file_path (str): Sales file to analyze, defaults to the configured sales file
+        db: Database connection (passed by pipeline executor, unused here)
+        dimensions (list): Cell dimensions, defaults to Category, Sub-Category, Region
+        bin_edges (list): Upper edges of the discount bins, defaults to 10/20/30/50/100%
+    Returns:
+        Result dictionary with one matrix entry per cell
+    """
+    try:
+        if sales_data is None:
+            df = load_sales_data(file_path, compact=True)
+        else:
+            df = sales_data if isinstance(sales_data, pd.DataFrame) else pd.DataFrame(sales_data)
+        matrix = promotion_correlations(df, dimensions, bin_edges)
+        result = {
+            "task_id": 6,
+            "pipeline_id": "AgentBI-Demo",
+            "schema_version": "v0.6.2",
+            "timestamp": datetime.now().strftime("%Y-%m-%d_%H:%M"),
+            "status": "success" if matrix else "no_data",
+            "dimensions": dimensions or PROMOTION_DIMENSIONS,
+            "discount_bins": _discount_bin_labels(bin_edges or DISCOUNT_BIN_EDGES),
+            "matrix": matrix,
+            "message": f"Computed promotion response for {len(matrix)} cells"
+        }
+        logger.info(result["message"])
+        return result
+    except Exception as e:
+        logger.error(f"Promotion analysis failed: {str(e)}", exc_info=True)
+        return {
+            "task_id": 6,
+            "pipeline_id": "AgentBI-Demo",
+            "schema_version": "v0.6.2",
+            "timestamp": datetime.now().strftime("%Y-%m-%d_%H:%M"),
+            "status": "error",
+            "matrix": [],
+            "message": f"Promotion analysis failed: {str(e)}"
+        }
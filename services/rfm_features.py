@@ -0,0 +1,139 @@
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from services.utils import to_day_numbers
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RFM_SCORE_BINS = 5
+RFM_FEATURES = [
+    'recency', 'monetary', 'frequency',
+    'log_monetary', 'log_frequency',
+    'recency_scaled', 'log_monetary_scaled', 'log_frequency_scaled',
+    'r_score', 'f_score', 'm_score', 'rfm_score'
+]
+
+def _today_day_number(current_date=None) -> int:
+    current_date = pd.Timestamp(current_date or datetime.now())
+    return int((current_date.normalize() - pd.Timestamp(0)).days)
+
+def _customer_codes(customers):
+    """Integer code per row and the customer id per code, ids in sorted order."""
+    if isinstance(customers.dtype, pd.CategoricalDtype):
+        if not customers.cat.categories.is_monotonic_increasing:
+            customers = customers.cat.reorder_categories(customers.cat.categories.sort_values())
+        return customers.cat.codes.to_numpy(), customers.cat.categories
+    codes, uniques = pd.factorize(customers, sort=True)
+    return codes, uniques
+
+def _zscore(values: np.ndarray) -> np.ndarray:
+    std = values.std()
+    return (values - values.mean()) / std if std > 0 else np.zeros_like(values)
+
+def _quantile_score(values: np.ndarray, higher_is_better: bool = True) -> np.ndarray:
+    """1..RFM_SCORE_BINS score from the rank of each value, ties broken by position."""
+    n = len(values)
+    if n == 0:
+        return np.zeros(0, dtype=np.int8)
+    ranks = np.empty(n, dtype=np.int64)
+    ranks[np.argsort(values if higher_is_better else -values, kind='stable')] = np.arange(n)
+    return (ranks * RFM_SCORE_BINS // n + 1).astype(np.int8)
+
+def _last_day_per_code(codes: np.ndarray, days: np.ndarray, n_codes: int) -> np.ndarray:
+    """
+    Latest day per code (-1 for codes without rows) from one sort and a
+    np.maximum.reduceat over the code boundaries. Code and day offset are
+    packed into one int64 key, so a plain sort orders rows by code without
+    a (much slower) stable argsort.
+    """
+    last_day = np.full(n_codes, -1, dtype=np.int64)
+    if len(codes) == 0:
+        return last_day
+    days = days.astype(np.int64)
+    first_day = days.min()
+    keys = np.sort((codes.astype(np.int64) << 32) | (days - first_day))
+    sorted_codes = keys >> 32
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    last_day[sorted_codes[starts]] = np.maximum.reduceat(keys & 0xFFFFFFFF, starts) + first_day
+    return last_day
+
+def rfm_from_aggregates(customer_ids, last_day, monetary, frequency, current_date=None) -> pd.DataFrame:
+    """
+    Derive the RFM feature frame from per-customer aggregates: last order day
+    number (-1 if unknown), sales sum and order count.
+    """
+    last_day = np.asarray(last_day, dtype=np.int64)
+    monetary = np.asarray(monetary, dtype=np.float64)
+    frequency = np.asarray(frequency, dtype=np.int64)
+    recency = np.where(last_day >= 0, _today_day_number(current_date) - last_day, np.nan)
+
+    known = ~np.isnan(recency)
+    recency_filled = np.where(known, recency, recency[known].max() if known.any() else 0.0)
+    log_monetary = np.log1p(np.clip(monetary, 0, None))
+    log_frequency = np.log1p(frequency)
+    # Unknown recency ranks as least recent
+    r_score = _quantile_score(np.where(known, recency, np.inf), higher_is_better=False)
+    f_score = _quantile_score(frequency)
+    m_score = _quantile_score(monetary)
+
+    rfm = pd.DataFrame({
+        'CustomerID': np.asarray(customer_ids, dtype=object),
+        'recency': recency,
+        'monetary': monetary,
+        'frequency': frequency,
+        'last_day': last_day,
+        'log_monetary': log_monetary,
+        'log_frequency': log_frequency,
+        'recency_scaled': _zscore(recency_filled),
+        'log_monetary_scaled': _zscore(log_monetary),
+        'log_frequency_scaled': _zscore(log_frequency),
+        'r_score': r_score,
+        'f_score': f_score,
+        'm_score': m_score,
+        'rfm_score': r_score.astype(np.int16) * 100 + f_score * 10 + m_score
+    })
+    if known.all():
+        rfm['recency'] = recency.astype(np.int64)
+    return rfm
+
+def build_rfm_features(df: pd.DataFrame, current_date=None) -> pd.DataFrame:
+    """
+    Build per-customer RFM features from a sales frame without a Python-level
+    groupby.
+
+    Customers are mapped to integer codes (straight from the categorical codes
+    for compact frames); monetary value and frequency are bincounts over the
+    codes and the last order day is a np.maximum.reduceat over the rows sorted
+    by code. Accepts either a compact frame (OrderDay) or one with an OrderDate
+    column.
+
+    Returns:
+        Frame with CustomerID (sorted), recency (days), monetary, frequency,
+        last order day number, log and z-scaled features, and 1-5 quantile R/F/M scores
+    """
+    codes, customer_ids = _customer_codes(df['CustomerID'])
+    if 'OrderDay' in df.columns:
+        days = df['OrderDay'].to_numpy()
+    else:
+        days = to_day_numbers(df['OrderDate'])
+    sales = df['Sales'].to_numpy(dtype=np.float64)
+
+    valid = codes >= 0
+    codes, days, sales = codes[valid], days[valid], sales[valid]
+    n_customers = len(customer_ids)
+    has_sales = ~np.isnan(sales)
+
+    rows = np.bincount(codes, minlength=n_customers)
+    monetary = np.bincount(codes, weights=np.where(has_sales, sales, 0.0), minlength=n_customers)
+    frequency = np.bincount(codes, weights=has_sales, minlength=n_customers).astype(np.int64)
+    last_day = _last_day_per_code(codes, days, n_customers)
+
+    # Drop categories with no rows (e.g. after filtering a categorical frame)
+    present = rows > 0
+    rfm = rfm_from_aggregates(
+        np.asarray(customer_ids)[present], last_day[present], monetary[present], frequency[present], current_date
+    )
+    logger.info(f"Built RFM features for {len(rfm)} customers from {len(sales)} rows")
+    return rfm
@@ -0,0 +1,153 @@
+import os
+import logging
+from typing import Dict, Any, List, Optional
+import numpy as np
+import pandas as pd
+from services.utils import SALES_DATA_PATH, load_sales_data, day_numbers_to_datetime
+from services.snapshot_cache import CACHE_DIR, source_fingerprint
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CUBE_DIMENSIONS = ['Category', 'Region', 'Segment']
+CUBE_MEASURES = ['Sales', 'Profit', 'Quantity']
+CUBE_VERSION = 1
+
+# Most recent cube per source file: {abs path: (sha256, cube)}
+_cubes: Dict[str, Any] = {}
+
+def build_rollup_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Roll a compact sales frame up to daily grain by Category x Region x Segment.
+
+    Each row's day offset and dimension codes are packed into one integer cell
+    key, and every measure is summed with a single bincount over the cells.
+    Dimensions missing from the frame are left out of the cube.
+    """
+    dimensions = [dim for dim in CUBE_DIMENSIONS if dim in df.columns]
+    measures = [measure for measure in CUBE_MEASURES if measure in df.columns]
+    days = df['OrderDay'].to_numpy()
+    valid = days >= 0
+    if not valid.any():
+        return pd.DataFrame(columns=['OrderDay'] + dimensions + measures + ['Orders'])
+
+    first_day = int(days[valid].min())
+    key = (days[valid] - first_day).astype(np.int64)
+    categories = {}
+    for dim in dimensions:
+        column = df[dim] if isinstance(df[dim].dtype, pd.CategoricalDtype) else df[dim].astype('category')
+        codes = column.cat.codes.to_numpy()[valid].astype(np.int64)
+        # Reserve slot 0 for missing values (code -1)
+        cardinality = len(column.cat.categories) + 1
+        key = key * cardinality + (codes + 1)
+        categories[dim] = (column.cat.categories, cardinality)
+
+    cells, inverse = np.unique(key, return_inverse=True)
+    cube = {}
+    remainder = cells
+    for dim in reversed(dimensions):
+        dim_categories, cardinality = categories[dim]
+        codes = remainder % cardinality - 1
+        remainder = remainder // cardinality
+        cube[dim] = pd.Categorical.from_codes(codes, categories=dim_categories)
+    cube = {'OrderDay': (remainder + first_day).astype(np.int32), **{dim: cube[dim] for dim in dimensions}}
+    for measure in measures:
+        values = df[measure].to_numpy(dtype=np.float64)[valid]
+        cube[measure] = np.bincount(inverse, weights=np.nan_to_num(values), minlength=len(cells))
+    cube['Orders'] = np.bincount(inverse, minlength=len(cells))
+    return pd.DataFrame(cube)
+
+def _cube_path(sha256: str) -> str:
+    return os.path.join(CACHE_DIR, f"cube_v{CUBE_VERSION}_{sha256[:24]}.npz")
+
+def _save_cube(cube: pd.DataFrame, path: str) -> None:
+    arrays = {}
+    for col in cube.columns:
+        if isinstance(cube[col].dtype, pd.CategoricalDtype):
+            arrays[f"codes:{col}"] = cube[col].cat.codes.to_numpy()
+            arrays[f"categories:{col}"] = np.asarray(cube[col].cat.categories, dtype=str)
+        else:
+            arrays[f"values:{col}"] = cube[col].to_numpy()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+def _read_cube(path: str) -> pd.DataFrame:
+    with np.load(path, allow_pickle=False) as data:
+        columns = {}
+        for name in data.files:
+            kind, col = name.split(":", 1)
+            if kind == "values":
+                columns[col] = data[name]
+            elif kind == "codes":
+                columns[col] = pd.Categorical.from_codes(data[name], categories=data[f"categories:{col}"].tolist())
+    ordered = ['OrderDay'] + [dim for dim in CUBE_DIMENSIONS if dim in columns]
+    ordered += [col for col in columns if col not in ordered]
+    return pd.DataFrame({col: columns[col] for col in ordered})
+
+def load_rollup_cube(file_path: str = None) -> pd.DataFrame:
+    """
+    Return the rollup cube for the current version of the sales file, building
+    it at most once per data version. Cubes are kept in memory per process and
+    persisted next to the sales snapshot so other workers can map them.
+    """
+    file_path = os.path.abspath(file_path or SALES_DATA_PATH)
+    sha256 = source_fingerprint(file_path)["sha256"]
+    cached = _cubes.get(file_path)
+    if cached and cached[0] == sha256:
+        return cached[1]
+
+    path = _cube_path(sha256)
+    cube = None
+    if os.path.exists(path):
+        try:
+            cube = _read_cube(path)
+            logger.info(f"Loaded rollup cube with {len(cube)} cells from {path}")
+        except Exception as e:
+            logger.warning(f"Failed to read rollup cube {path}: {str(e)}")
+    if cube is None:
+        cube = build_rollup_cube(load_sales_data(file_path, compact=True))
+        logger.info(f"Built rollup cube with {len(cube)} cells for {file_path}")
+        try:
+            _save_cube(cube, path)
+        except Exception as e:
+            logger.warning(f"Failed to persist rollup cube {path}: {str(e)}")
+    _cubes[file_path] = (sha256, cube)
+    return cube
+
+def query_cube(
+    cube: pd.DataFrame,
+    filters: Optional[Dict[str, Any]] = None,
+    by: Optional[List[str]] = None,
+    measures: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    Answer a drill-down query from the cube.
+
+    Args:
+        cube: Cube from load_rollup_cube
+        filters: Dimension values to keep, e.g. {"Category": "Technology"} or {"Region": ["East", "West"]}
+        by: Dimensions to keep in the output besides the day, e.g. ["Region"]
+        measures: Measures to sum, defaults to all of them
+    Returns:
+        Frame with OrderDate, the `by` dimensions and the summed measures
+    """
+    by = by or []
+    measures = measures or [col for col in CUBE_MEASURES + ['Orders'] if col in cube.columns]
+    unknown = [dim for dim in list((filters or {}).keys()) + by if dim not in cube.columns]
+    if unknown:
+        raise ValueError(f"Unknown cube dimensions: {unknown}")
+
+    mask = np.ones(len(cube), dtype=bool)
+    for dim, values in (filters or {}).items():
+        values = values if isinstance(values, (list, tuple, set)) else [values]
+        mask &= cube[dim].isin(values).to_numpy()
+    selected = cube[mask]
+    grouped = selected.groupby(['OrderDay'] + by, observed=True, sort=True)[measures].sum().reset_index()
+    grouped.insert(0, 'OrderDate', day_numbers_to_datetime(grouped.pop('OrderDay').to_numpy()))
+    return grouped
+
+def cube_daily_sales(file_path: str = None, filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """Per-day sales sums from the cube, optionally restricted to a drill-down slice."""
+    return query_cube(load_rollup_cube(file_path), filters=filters, measures=['Sales'])
@@ -0,0 +1,137 @@
+import os
+import uuid
+import logging
+from typing import Dict, Any, List, Optional
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from pymongo import DESCENDING
+from services.snapshot_cache import CACHE_DIR
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MODEL_COLLECTION = "segmentation_models"
+MODEL_VERSION = 1
+# Per-customer inputs compared between runs to decide who needs re-assigning.
+# Recency moves every day for everyone, so it is compared via the last order day.
+STATE_COLUMNS = ['last_day', 'monetary', 'frequency']
+# Fall back to a cold fit if any feature mean moved by more than this many stds
+DRIFT_THRESHOLD = 0.5
+WARM_START_MAX_ITER = 20
+
+def _state_path(model_id: str) -> str:
+    return os.path.join(CACHE_DIR, f"segmentation_state_{model_id}.npz")
+
+def load_previous_model(db, pipeline_id: str, features: List[str], n_clusters: int, engine_mode: str) -> Optional[Dict[str, Any]]:
+    """
+    Latest fitted model for this pipeline, feature set, cluster count and engine
+    mode, with its per-customer state, or None if there is nothing usable to
+    warm start from.
+    """
+    doc = db[MODEL_COLLECTION].find_one(
+        {
+            "pipeline_id": pipeline_id,
+            "features": features,
+            "n_clusters": n_clusters,
+            "engine_mode": engine_mode,
+            "model_version": MODEL_VERSION
+        },
+        sort=[("created_at", DESCENDING)]
+    )
+    if not doc:
+        return None
+    path = _state_path(doc["model_id"])
+    if not os.path.exists(path):
+        logger.info(f"Customer state for segmentation model {doc['model_id']} is missing, fitting from scratch")
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            state = {name: data[name] for name in data.files}
+    except Exception as e:
+        logger.warning(f"Failed to read customer state {path}: {str(e)}")
+        return None
+    return {
+        "model_id": doc["model_id"],
+        "centroids": np.asarray(doc["centroids"], dtype=np.float64),
+        "feature_mean": np.asarray(doc["feature_mean"], dtype=np.float64),
+        "feature_std": np.asarray(doc["feature_std"], dtype=np.float64),
+        "label_map": doc["label_map"],
+        "state": state
+    }
+
+def feature_drift(previous: Dict[str, Any], X: np.ndarray) -> float:
+    """Largest shift of a feature mean since the previous fit, in previous stds."""
+    std = np.where(previous["feature_std"] > 0, previous["feature_std"], 1.0)
+    return float(np.max(np.abs(X.mean(axis=0) - previous["feature_mean"]) / std))
+
+def changed_customers(previous: Dict[str, Any], rfm: pd.DataFrame):
+    """
+    Align the previous per-customer state with the current RFM frame.
+
+    Returns:
+        Previous cluster index per current customer (-1 for new customers) and a
+        mask of customers that are new or whose inputs changed since the last run
+    """
+    state = previous["state"]
+    position = pd.Index(state["customer_ids"]).get_indexer(rfm['CustomerID'].astype(str))
+    known = position >= 0
+    labels = np.full(len(rfm), -1, dtype=np.int64)
+    labels[known] = state["labels"][position[known]]
+    changed = ~known
+    for col in STATE_COLUMNS:
+        current = rfm[col].to_numpy(dtype=np.float64)[known]
+        changed[known] |= ~np.isclose(current, state[col][position[known]])
+    return labels, changed
+
+def save_model(
+    db,
+    pipeline_id: str,
+    features: List[str],
+    n_clusters: int,
+    centroids: np.ndarray,
+    X: np.ndarray,
+    labels: np.ndarray,
+    label_map: List[str],
+    rfm: pd.DataFrame,
+    engine_mode: str,
+    previous_model_id: str = None
+) -> str:
+    """
+    Store the fitted centroids and feature scaling in Mongo and the per-customer
+    state next to the data snapshots, replacing the previous state file.
+    """
+    model_id = uuid.uuid4().hex
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    state = {col: rfm[col].to_numpy(dtype=np.float64) for col in STATE_COLUMNS}
+    path = _state_path(model_id)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(
+        tmp_path,
+        customer_ids=rfm['CustomerID'].astype(str).to_numpy(dtype=str),
+        labels=np.asarray(labels, dtype=np.int64),
+        **state
+    )
+    os.replace(tmp_path, path)
+
+    db[MODEL_COLLECTION].insert_one({
+        "model_id": model_id,
+        "model_version": MODEL_VERSION,
+        "pipeline_id": pipeline_id,
+        "features": features,
+        "n_clusters": n_clusters,
+        "engine_mode": engine_mode,
+        "centroids": np.asarray(centroids, dtype=np.float64).tolist(),
+        "feature_mean": X.mean(axis=0).tolist(),
+        "feature_std": X.std(axis=0).tolist(),
+        "label_map": label_map,
+        "n_customers": int(len(rfm)),
+        "previous_model_id": previous_model_id,
+        "created_at": datetime.now()
+    })
+    if previous_model_id:
+        try:
+            os.remove(_state_path(previous_model_id))
+        except OSError:
+            pass
+    return model_id
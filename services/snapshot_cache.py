@@ -0,0 +1,157 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Any, Optional
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv("AGENTBI_CACHE_DIR", os.path.join(os.path.dirname(__file__), "cache"))
+SNAPSHOT_FORMAT_VERSION = 2
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+# Last fingerprint seen per source file in this process: {abs path: fingerprint}
+_fingerprints: Dict[str, Dict[str, Any]] = {}
+
+def file_fingerprint(file_path: str, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Fingerprint a source file by size, mtime and content hash.
+
+    If a previous fingerprint with the same size and mtime is given, its hash is
+    reused so that warm lookups do not have to re-read the whole file.
+    """
+    stat = os.stat(file_path)
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if previous and previous.get("size") == fingerprint["size"] and previous.get("mtime_ns") == fingerprint["mtime_ns"]:
+        fingerprint["sha256"] = previous.get("sha256")
+        return fingerprint
+
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    fingerprint["sha256"] = digest.hexdigest()
+    return fingerprint
+
+def _snapshot_dir(file_path: str) -> str:
+    key = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, f"snapshot_{key}")
+
+def _read_manifest(snapshot_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(snapshot_dir, "manifest.json"), "r") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            return None
+        return manifest
+    except (OSError, ValueError):
+        return None
+
+def source_fingerprint(file_path: str) -> Dict[str, Any]:
+    """
+    Fingerprint file_path, reusing the hash recorded in its snapshot manifest when
+    size and mtime still match. This is the data version for derived caches.
+    """
+    file_path = os.path.abspath(file_path)
+    previous = _fingerprints.get(file_path)
+    if previous is None:
+        manifest = _read_manifest(_snapshot_dir(file_path))
+        previous = manifest["fingerprint"] if manifest else None
+    fingerprint = file_fingerprint(file_path, previous=previous)
+    _fingerprints[file_path] = fingerprint
+    return fingerprint
+
+def load_snapshot(file_path: str, as_category: bool = False) -> Optional[pd.DataFrame]:
+    """
+    Map a cached columnar snapshot of file_path, or return None if there is no
+    snapshot or the source file changed since it was written. With as_category,
+    string columns are returned as categoricals built straight from the stored
+    codes instead of being decoded to object strings.
+    """
+    snapshot_dir = _snapshot_dir(file_path)
+    manifest = _read_manifest(snapshot_dir)
+    if manifest is None:
+        return None
+
+    fingerprint = source_fingerprint(file_path)
+    if fingerprint["sha256"] != manifest["fingerprint"]["sha256"]:
+        logger.info(f"Snapshot for {file_path} is stale, source file changed")
+        return None
+
+    try:
+        columns = {}
+        for column in manifest["columns"]:
+            values = np.load(os.path.join(snapshot_dir, column["file"]), mmap_mode="r")
+            if column["kind"] == "datetime":
+                columns[column["name"]] = pd.DatetimeIndex(values.view("M8[ns]"))
+            elif column["kind"] == "string":
+                categories = pd.Index(np.load(os.path.join(snapshot_dir, column["categories_file"])), dtype=object)
+                columns[column["name"]] = pd.Categorical.from_codes(values, categories=categories)
+            else:
+                columns[column["name"]] = values
+        # copy=False keeps the numeric and datetime columns backed by the mapped files
+        df = pd.DataFrame(columns, copy=False)
+        if not as_category:
+            for column in manifest["columns"]:
+                if column["kind"] == "string":
+                    df[column["name"]] = df[column["name"]].astype(object)
+        logger.info(f"Loaded {len(df)} rows from snapshot {snapshot_dir}")
+        return df
+    except Exception as e:
+        logger.warning(f"Failed to read snapshot {snapshot_dir}: {str(e)}")
+        return None
+
+def write_snapshot(file_path: str, df: pd.DataFrame, fingerprint: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Write df as a columnar snapshot of file_path: one .npy file per column, object
+    columns dictionary-encoded, plus a manifest holding the source fingerprint.
+    The snapshot is built in a temp directory and swapped in with a rename so
+    concurrent workers never see a partial snapshot. Pass the fingerprint taken
+    before parsing so a file modified mid-parse is not cached under its new hash.
+    """
+    snapshot_dir = _snapshot_dir(file_path)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix="snapshot_tmp_", dir=CACHE_DIR)
+    try:
+        columns = []
+        for i, name in enumerate(df.columns):
+            series = df[name]
+            file_name = f"col_{i}.npy"
+            column = {"name": name, "file": file_name}
+            if pd.api.types.is_datetime64_any_dtype(series):
+                column["kind"] = "datetime"
+                values = series.to_numpy(dtype="M8[ns]").view("i8")
+            elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                column["kind"] = "numeric"
+                values = series.to_numpy()
+            else:
+                column["kind"] = "string"
+                codes, uniques = pd.factorize(series.astype(object))
+                values = codes.astype(np.int32)
+                column["categories_file"] = f"col_{i}_categories.npy"
+                np.save(os.path.join(tmp_dir, column["categories_file"]), np.asarray(uniques, dtype=str))
+            np.save(os.path.join(tmp_dir, file_name), values)
+            columns.append(column)
+
+        manifest = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "source": os.path.abspath(file_path),
+            "fingerprint": fingerprint or file_fingerprint(file_path),
+            "rows": int(len(df)),
+            "columns": columns
+        }
+        with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+
+        if os.path.exists(snapshot_dir):
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+        os.replace(tmp_dir, snapshot_dir)
+        logger.info(f"Wrote snapshot of {file_path} to {snapshot_dir}")
+    except Exception as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        logger.warning(f"Failed to write snapshot for {file_path}: {str(e)}")
@@ -2,11 +2,25 @@
 from typing import List, Dict, Any
 from datetime import datetime
 import logging
+from services.threshold_rules import evaluate_thresholds, load_rules
+from services.trigger_state import evaluate_incremental
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def check_thresholds(segmentation_stats: List[Dict[str, Any]] = None, cash_flow_data: List[Dict[str, Any]] = None, db=None) -> Dict[str, Any]:
+def check_thresholds(
+    segmentation_stats: List[Dict[str, Any]] = None,
+    cash_flow_data: List[Dict[str, Any]] = None,
+    db=None,
+    rules: List[Dict[str, Any]] = None,
+    incremental: bool = True,
+    cooldown_minutes: float = None
+) -> Dict[str, Any]:
+    """
+    Evaluate the threshold rules. With a db and incremental=True, only inputs
+    that changed since the last run are evaluated and repeats of a trigger
+    within the cooldown are suppressed (see services/trigger_state).
+    """
     try:
         logger.info(f"Checking thresholds with segmentation_stats: {len(segmentation_stats) if segmentation_stats else 0}, cash_flow_data: {len(cash_flow_data) if cash_flow_data else 0}")
         
@@ -18,29 +32,14 @@ def check_thresholds(segmentation_stats: List[Dict[str, Any]] = None, cash_flow_
             logger.warning("cash_flow_data is None, using empty list")
             cash_flow_data = []
         
-        triggers = []
-        # Threshold logic for segmentation_stats
-        for segment in segmentation_stats:
-            segment_id = segment.get("id", "unknown")
-            avg_order_value = segment.get("avgOrderValue", 0.0)
-            if avg_order_value > 1000:
-                triggers.append({
-                    "segment_id": segment_id,
-                    "trigger_type": "high_value_segment",
-                    "value": avg_order_value,
-                    "threshold": 1000
-                })
-        
-        # Threshold logic for cash_flow_data
-        for cash_flow in cash_flow_data:
-            revenue = cash_flow.get("sales", 0.0)  # Matches cashflow_engine.py output
-            if revenue < 5000:
-                triggers.append({
-                    "period": cash_flow.get("period", "unknown"),
-                    "trigger_type": "low_cash_flow",
-                    "value": revenue,
-                    "threshold": 5000
-                })
+        # Rules come from the threshold_rules collection or config/default_config.yaml
+        state = {}
+        if db is not None and incremental:
+            rules = rules if rules is not None else load_rules(db)
+            state = evaluate_incremental(db, rules, segmentation_stats, cash_flow_data, cooldown_minutes=cooldown_minutes)
+            triggers = state.pop("triggers")
+        else:
+            triggers = evaluate_thresholds(segmentation_stats, cash_flow_data, rules=rules, db=db)
         
         result = {
             "task_id": 7,
@@ -48,6 +47,7 @@ def check_thresholds(segmentation_stats: List[Dict[str, Any]] = None, cash_flow_
             "schema_version": "v0.6.2",
             "timestamp": datetime.now().strftime("%Y-%m-%d_%H:%M"),
             "triggers": triggers,
+            **state,
             "status": "success",
             "message": f"Processed {len(triggers)} triggers"
         }
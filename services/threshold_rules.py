@@ -0,0 +1,178 @@
+import json
+import logging
+from typing import Dict, Any, List, Optional
+import numpy as np
+from config import load_config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RULE_COLLECTION = "threshold_rules"
+RULE_OPERATORS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+    "!=": np.not_equal
+}
+RULE_AGGREGATES = ["mean", "sum"]
+# Per source: the record field identifying an entity and the key it is reported under
+RULE_SOURCES = {
+    "segments": {"id_field": "id", "key": "segment_id"},
+    "cash_flow": {"id_field": "period", "key": "period"}
+}
+
+# Compiled rule sets by their JSON definition, so each set is compiled once per process
+_compiled: Dict[str, List[Dict[str, Any]]] = {}
+
+def load_rules(db=None) -> List[Dict[str, Any]]:
+    """Enabled rules from the threshold_rules collection, else from the YAML config."""
+    if db is not None:
+        try:
+            rules = list(db[RULE_COLLECTION].find({"enabled": {"$ne": False}}, {"_id": 0}))
+            if rules:
+                return rules
+        except Exception as e:
+            logger.warning(f"Failed to read threshold rules from Mongo, using config: {str(e)}")
+    return load_config().get("threshold_rules", [])
+
+def compile_rules(rules: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Validate rules and group them by (source, field, window, aggregate), the
+    inputs they share. Each group holds its rules' thresholds and operators as
+    arrays, so a whole group is evaluated with one broadcasted comparison per
+    operator.
+    """
+    key = json.dumps(rules, sort_keys=True, default=str)
+    if key in _compiled:
+        return _compiled[key]
+
+    groups: Dict[tuple, Dict[str, Any]] = {}
+    for position, rule in enumerate(rules):
+        name = rule.get("name", f"rule_{position}")
+        source = rule.get("source")
+        operator = rule.get("operator")
+        aggregate = rule.get("aggregate", "mean")
+        window = int(rule.get("window", 1))
+        if source not in RULE_SOURCES:
+            raise ValueError(f"Rule {name}: unknown source '{source}', expected one of {list(RULE_SOURCES)}")
+        if operator not in RULE_OPERATORS:
+            raise ValueError(f"Rule {name}: unknown operator '{operator}', expected one of {list(RULE_OPERATORS)}")
+        if aggregate not in RULE_AGGREGATES:
+            raise ValueError(f"Rule {name}: unknown aggregate '{aggregate}', expected one of {RULE_AGGREGATES}")
+        if window < 1 or not rule.get("field") or "threshold" not in rule:
+            raise ValueError(f"Rule {name}: needs a field, a threshold and a window >= 1")
+        group = groups.setdefault((source, rule["field"], window, aggregate), {
+            "source": source, "field": rule["field"], "window": window, "aggregate": aggregate,
+            "positions": [], "names": [], "operators": [], "thresholds": [], "severities": []
+        })
+        group["positions"].append(position)
+        group["names"].append(name)
+        group["operators"].append(operator)
+        group["thresholds"].append(rule["threshold"])
+        group["severities"].append(rule.get("severity", "info"))
+
+    compiled = []
+    for group in groups.values():
+        operators = np.array(group["operators"])
+        compiled.append({
+            **group,
+            "positions": np.array(group["positions"]),
+            "threshold_values": np.array(group["thresholds"], dtype=np.float64),
+            "operator_rows": {op: np.flatnonzero(operators == op) for op in np.unique(operators)}
+        })
+    _compiled[key] = compiled
+    logger.info(f"Compiled {len(rules)} threshold rules into {len(compiled)} groups")
+    return compiled
+
+def to_columns(records: List[Dict[str, Any]], id_field: str, fields: List[str]) -> Dict[str, np.ndarray]:
+    """Columnar view of a list of segment / period dicts (missing values read as 0.0)."""
+    columns = {"ids": np.array([record.get(id_field, "unknown") for record in records], dtype=object)}
+    for field in fields:
+        columns[field] = np.array([record.get(field, 0.0) or 0.0 for record in records], dtype=np.float64)
+    return columns
+
+def _windowed(values: np.ndarray, window: int, aggregate: str) -> np.ndarray:
+    """Rolling sum/mean over the last `window` periods; NaN until a full window is available."""
+    if window == 1:
+        return values
+    totals = np.cumsum(np.r_[0.0, values])
+    rolled = np.full(len(values), np.nan)
+    rolled[window - 1:] = totals[window:] - totals[:-window]
+    return rolled / window if aggregate == "mean" else rolled
+
+def affected_entities(compiled: List[Dict[str, Any]], source: str, changed: np.ndarray) -> np.ndarray:
+    """
+    Entities whose rule values can differ after `changed` entities changed:
+    a windowed value moves when any period inside its window moved, so each
+    change is spread forward over the widest window of the source's rules.
+    """
+    window = max([group["window"] for group in compiled if group["source"] == source], default=1)
+    if window == 1:
+        return changed
+    counts = np.cumsum(np.r_[0, changed.astype(np.int64)])
+    starts = np.maximum(np.arange(len(changed)) - window + 1, 0)
+    return (counts[1:] - counts[starts]) > 0
+
+def evaluate_rules(
+    compiled: List[Dict[str, Any]],
+    columns: Dict[str, Dict[str, np.ndarray]],
+    affected: Optional[Dict[str, np.ndarray]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Evaluate compiled rules against columnar inputs per source. With
+    `affected` ({source: boolean mask}), only the masked entities can fire.
+
+    Returns:
+        Triggers ordered by rule, then by entity: rule name as trigger_type, the
+        entity key (segment_id or period), value, threshold and severity
+    """
+    fired = []
+    for group in compiled:
+        source_columns = columns.get(group["source"])
+        if source_columns is None or len(source_columns["ids"]) == 0:
+            continue
+        values = _windowed(source_columns[group["field"]], group["window"], group["aggregate"])
+        hits = np.zeros((len(group["thresholds"]), len(values)), dtype=bool)
+        for op, rows in group["operator_rows"].items():
+            with np.errstate(invalid='ignore'):
+                hits[rows] = RULE_OPERATORS[op](values[None, :], group["threshold_values"][rows, None])
+        if affected is not None and group["source"] in affected:
+            hits &= affected[group["source"]][None, :]
+        rule_idx, entity_idx = np.nonzero(hits)
+        key = RULE_SOURCES[group["source"]]["key"]
+        for r, e in zip(rule_idx, entity_idx):
+            fired.append((group["positions"][r], e, {
+                key: source_columns["ids"][e],
+                "trigger_type": group["names"][r],
+                "value": float(values[e]),
+                "threshold": group["thresholds"][r],
+                "severity": group["severities"][r],
+                "window": group["window"]
+            }))
+    fired.sort(key=lambda item: (item[0], item[1]))
+    return [trigger for _, _, trigger in fired]
+
+def build_columns(
+    compiled: List[Dict[str, Any]],
+    segmentation_stats: List[Dict[str, Any]],
+    cash_flow_data: List[Dict[str, Any]]
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """Columnar inputs per source, holding only the fields the compiled rules read."""
+    records = {"segments": segmentation_stats or [], "cash_flow": cash_flow_data or []}
+    columns = {}
+    for source, source_records in records.items():
+        fields = sorted({group["field"] for group in compiled if group["source"] == source})
+        columns[source] = to_columns(source_records, RULE_SOURCES[source]["id_field"], fields)
+    return columns
+
+def evaluate_thresholds(
+    segmentation_stats: List[Dict[str, Any]],
+    cash_flow_data: List[Dict[str, Any]],
+    rules: Optional[List[Dict[str, Any]]] = None,
+    db=None
+) -> List[Dict[str, Any]]:
+    """Load (if not given), compile and evaluate threshold rules over segments and cash flow periods."""
+    compiled = compile_rules(rules if rules is not None else load_rules(db))
+    return evaluate_rules(compiled, build_columns(compiled, segmentation_stats, cash_flow_data))
@@ -0,0 +1,176 @@
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, List
+import numpy as np
+from pymongo import UpdateOne, DeleteMany, ASCENDING
+from config import load_config
+from services.threshold_rules import RULE_SOURCES, compile_rules, build_columns, affected_entities, evaluate_rules
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATE_COLLECTION = "trigger_state"
+DEFAULT_COOLDOWN_MINUTES = 60
+
+def ensure_state_indexes(db) -> None:
+    db[STATE_COLLECTION].create_index([("pipeline_id", ASCENDING), ("kind", ASCENDING), ("source", ASCENDING), ("entity", ASCENDING)])
+    db[STATE_COLLECTION].create_index([("pipeline_id", ASCENDING), ("kind", ASCENDING), ("key", ASCENDING)])
+
+def rules_fingerprint(rules: List[Dict[str, Any]]) -> str:
+    payload = json.dumps(rules, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def trigger_key(trigger: Dict[str, Any], source: str) -> str:
+    """State key of one (rule, entity) pair."""
+    return f"{trigger['trigger_type']}|{source}|{trigger[RULE_SOURCES[source]['key']]}"
+
+def trigger_source(trigger: Dict[str, Any]) -> str:
+    return next(source for source, spec in RULE_SOURCES.items() if spec["key"] in trigger)
+
+def load_input_state(db, pipeline_id: str) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Last evaluated inputs as {source: {entity: {"values": {...}, "position": i}}}."""
+    state = {source: {} for source in RULE_SOURCES}
+    for doc in db[STATE_COLLECTION].find({"pipeline_id": pipeline_id, "kind": "input"}, {"_id": 0}):
+        state.setdefault(doc["source"], {})[doc["entity"]] = doc
+    return state
+
+def changed_entities(columns: Dict[str, np.ndarray], stored: Dict[str, Dict[str, Any]]) -> np.ndarray:
+    """
+    Entities whose rule inputs differ from the stored state: new entities,
+    changed field values, or a moved position (which shifts rolling windows).
+    """
+    ids = [str(entity) for entity in columns["ids"]]
+    fields = [name for name in columns if name != "ids"]
+    changed = np.array([entity not in stored or stored[entity].get("position") != i for i, entity in enumerate(ids)], dtype=bool)
+    for field in fields:
+        previous = np.array([stored.get(entity, {}).get("values", {}).get(field, np.nan) for entity in ids], dtype=np.float64)
+        changed |= ~(previous == columns[field])
+    return changed
+
+def coalesce_triggers(db, triggers: List[Dict[str, Any]], pipeline_id: str, now: datetime, cooldown: timedelta):
+    """
+    Split fired triggers into emitted and suppressed. A (rule, entity) pair
+    that already fired with the same severity within the cooldown is
+    suppressed and counted on its state; the next emission after the
+    cooldown reports how many repeats it coalesced.
+
+    Returns:
+        (emitted triggers, suppressed count, state write operations)
+    """
+    keyed = [(trigger, trigger_source(trigger)) for trigger in triggers]
+    keys = [trigger_key(trigger, source) for trigger, source in keyed]
+    previous = {
+        doc["key"]: doc
+        for doc in db[STATE_COLLECTION].find({"pipeline_id": pipeline_id, "kind": "fire", "key": {"$in": keys}})
+    } if keys else {}
+    emitted, suppressed, operations = [], 0, []
+    for (trigger, source), key in zip(keyed, keys):
+        state = previous.get(key)
+        selector = {"pipeline_id": pipeline_id, "kind": "fire", "key": key}
+        if state and now - state["last_fired_at"] < cooldown and state.get("severity") == trigger["severity"]:
+            suppressed += 1
+            operations.append(UpdateOne(selector, {"$set": {"last_value": trigger["value"], "last_seen_at": now}, "$inc": {"coalesced": 1}}))
+            continue
+        trigger["coalesced"] = state.get("coalesced", 0) if state else 0
+        emitted.append(trigger)
+        operations.append(UpdateOne(selector, {"$set": {
+            "source": source,
+            "entity": str(trigger[RULE_SOURCES[source]["key"]]),
+            "rule": trigger["trigger_type"],
+            "severity": trigger["severity"],
+            "last_value": trigger["value"],
+            "last_fired_at": now,
+            "last_seen_at": now,
+            "coalesced": 0
+        }}, upsert=True))
+    return emitted, suppressed, operations
+
+def evaluate_incremental(
+    db,
+    rules: List[Dict[str, Any]],
+    segmentation_stats: List[Dict[str, Any]],
+    cash_flow_data: List[Dict[str, Any]],
+    pipeline_id: str = "AgentBI-Demo",
+    cooldown_minutes: float = None
+) -> Dict[str, Any]:
+    """
+    Evaluate threshold rules against what changed since the last run.
+
+    The trigger_state collection keeps one "input" document per segment /
+    period (last values and position), one "fire" document per firing
+    (rule, entity) pair (last value, last fire time, coalesced repeats) and
+    one "rules" document with the rule set fingerprint. Only entities whose
+    inputs changed (and the periods whose windows cover them) are evaluated;
+    a changed rule set re-evaluates everything. Repeats within the cooldown
+    are suppressed, pairs that stop firing are cleared, and all state
+    updates go out in one unordered bulk_write, so writes scale with the
+    number of changes rather than with the input size.
+
+    Returns:
+        Dictionary with the emitted triggers, evaluated entity counts per
+        source, the suppressed count and the number of state writes
+    """
+    if cooldown_minutes is None:
+        cooldown_minutes = load_config().get("trigger_cooldown_minutes", DEFAULT_COOLDOWN_MINUTES)
+    ensure_state_indexes(db)
+    now = datetime.now()
+    compiled = compile_rules(rules)
+    columns = build_columns(compiled, segmentation_stats, cash_flow_data)
+    fingerprint = rules_fingerprint(rules)
+    meta = db[STATE_COLLECTION].find_one({"pipeline_id": pipeline_id, "kind": "rules"}) or {}
+    rules_changed = meta.get("rules_hash") != fingerprint
+    stored = load_input_state(db, pipeline_id)
+
+    operations, affected = [], {}
+    for source, source_columns in columns.items():
+        n = len(source_columns["ids"])
+        changed = np.ones(n, dtype=bool) if rules_changed else changed_entities(source_columns, stored.get(source, {}))
+        affected[source] = affected_entities(compiled, source, changed)
+        fields = [name for name in source_columns if name != "ids"]
+        for i in np.flatnonzero(changed):
+            entity = str(source_columns["ids"][i])
+            operations.append(UpdateOne(
+                {"pipeline_id": pipeline_id, "kind": "input", "source": source, "entity": entity},
+                {"$set": {
+                    "values": {field: float(source_columns[field][i]) for field in fields},
+                    "position": int(i),
+                    "last_evaluated_at": now
+                }},
+                upsert=True
+            ))
+
+    triggers = evaluate_rules(compiled, columns, affected)
+    emitted, suppressed, fire_operations = coalesce_triggers(db, triggers, pipeline_id, now, timedelta(minutes=cooldown_minutes))
+    operations.extend(fire_operations)
+
+    # Evaluated pairs that no longer fire are resolved and may fire again immediately
+    for source, mask in affected.items():
+        if not mask.any():
+            continue
+        still_firing = [trigger_key(trigger, source) for trigger in triggers if trigger_source(trigger) == source]
+        operations.append(DeleteMany({
+            "pipeline_id": pipeline_id,
+            "kind": "fire",
+            "source": source,
+            "entity": {"$in": [str(entity) for entity in columns[source]["ids"][mask]]},
+            "key": {"$nin": still_firing}
+        }))
+    if rules_changed:
+        operations.append(UpdateOne(
+            {"pipeline_id": pipeline_id, "kind": "rules"},
+            {"$set": {"rules_hash": fingerprint, "updated_at": now}},
+            upsert=True
+        ))
+    if operations:
+        db[STATE_COLLECTION].bulk_write(operations, ordered=False)
+
+    evaluated = {source: int(mask.sum()) for source, mask in affected.items()}
+    logger.info(f"Incremental threshold check: evaluated {evaluated}, {len(emitted)} emitted, {suppressed} suppressed, {len(operations)} state writes")
+    return {
+        "triggers": emitted,
+        "evaluated": evaluated,
+        "suppressed": suppressed,
+        "state_writes": len(operations)
+    }
@@ -1,33 +1,145 @@
-
+import os
+import numpy as np
 import pandas as pd
 import logging
+from services.snapshot_cache import file_fingerprint, load_snapshot, write_snapshot
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def load_sales_data():
+SALES_DATA_PATH = os.getenv(
+    "AGENTBI_SALES_DATA_PATH",
+    "/Users/mohammednihal/Desktop/Business Intelligence/AgentBI/Backend/mock_data/sales_BI.csv"
+)
+DEFAULT_CHUNK_SIZE = 250_000
+COLUMN_ALIASES = {'Customer ID': 'CustomerID', 'Order Date': 'OrderDate'}
+
+# Compact in-memory schema for the sales frame. Strings are dictionary-encoded,
+# discounts are float32, counts and ids are int32, and dates become int32 day
+# numbers (days since 1970-01-01) under the mapped column name. Money (Sales,
+# Profit) stays float64: float32 noise would show in every reported aggregate.
+CATEGORICAL_COLUMNS = [
+    'CustomerID', 'Product ID', 'Category', 'Sub-Category', 'Region', 'Segment', 'City', 'State',
+    'Country/Region', 'Order ID', 'Customer Name', 'Product Name', 'Ship Mode'
+]
+FLOAT32_COLUMNS = ['Discount']
+INT32_COLUMNS = ['Row ID', 'Quantity', 'Postal Code']
+DAY_NUMBER_COLUMNS = {'OrderDate': 'OrderDay', 'Ship Date': 'ShipDay'}
+NS_PER_DAY = 86_400 * 10**9
+
+def normalize_sales_frame(df):
+    # Ensure correct column names
+    df = df.rename(columns={col: alias for col, alias in COLUMN_ALIASES.items() if col in df.columns})
+
+    # Verify required columns
+    required_columns = ['CustomerID', 'OrderDate', 'Sales']
+    missing_columns = [col for col in required_columns if col not in df.columns]
+    if missing_columns:
+        logger.error(f"Missing required columns in sales data: {missing_columns}")
+        raise ValueError(f"Missing required columns: {missing_columns}")
+
+    # Convert OrderDate to datetime
+    df['OrderDate'] = pd.to_datetime(df['OrderDate'], errors='coerce')
+    return df
+
+def to_day_numbers(values) -> np.ndarray:
+    """Convert datetimes to int32 days since 1970-01-01 (NaT becomes -1)."""
+    values = pd.to_datetime(values, errors='coerce')
+    ns = np.asarray(values, dtype='M8[ns]').view('i8')
+    days = (ns // NS_PER_DAY).astype(np.int32)
+    days[ns == np.iinfo(np.int64).min] = -1
+    return days
+
+def day_numbers_to_datetime(days) -> pd.DatetimeIndex:
+    """Inverse of to_day_numbers."""
+    return pd.DatetimeIndex(np.asarray(days, dtype='i8').astype('M8[D]').astype('M8[ns]'))
+
+def log_memory_usage(df: pd.DataFrame, label: str = "sales frame") -> int:
+    usage = df.memory_usage(deep=True, index=False)
+    total = int(usage.sum())
+    top = ", ".join(f"{col}={size / 2**20:.1f}MB" for col, size in usage.sort_values(ascending=False).head(5).items())
+    logger.info(f"Memory for {label}: {total / 2**20:.1f}MB over {len(df)} rows ({top})")
+    return total
+
+def apply_compact_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cast the sales frame to the compact schema above. Columns not covered by the
+    schema are left alone; rows with unparseable dates keep day number -1.
+    """
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if col in DAY_NUMBER_COLUMNS:
+            columns[DAY_NUMBER_COLUMNS[col]] = to_day_numbers(series)
+        elif col in CATEGORICAL_COLUMNS:
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                # Keep categories sorted so groupby order matches object-dtype strings
+                columns[col] = series.cat.reorder_categories(series.cat.categories.sort_values())
+            else:
+                columns[col] = series.astype('category')
+        elif col in FLOAT32_COLUMNS:
+            columns[col] = series.astype(np.float32)
+        elif col in INT32_COLUMNS and pd.api.types.is_integer_dtype(series):
+            columns[col] = series.astype(np.int32)
+        else:
+            columns[col] = series
+    return pd.DataFrame(columns)
+
+def load_sales_data(file_path: str = None, use_cache: bool = True, compact: bool = False):
+    """
+    Load the sales file as a DataFrame, from the columnar snapshot when possible.
+
+    With compact=True the frame uses the compact schema: categorical strings,
+    float32 discounts, int32 counts and an int32 OrderDay column instead of OrderDate.
+    """
     try:
-        file_path = "/Users/mohammednihal/Desktop/Business Intelligence/AgentBI/Backend/mock_data/sales_BI.csv"
+        file_path = file_path or SALES_DATA_PATH
+        if use_cache:
+            df = load_snapshot(file_path, as_category=compact)
+            if df is not None:
+                if compact:
+                    df = apply_compact_schema(df)
+                    log_memory_usage(df, "compact sales frame")
+                return df
+
         logger.info(f"Loading sales data from {file_path}")
-        df = pd.read_csv(file_path)
-        
-        # Ensure correct column names
-        if 'Customer ID' in df.columns:
-            df = df.rename(columns={'Customer ID': 'CustomerID'})
-        if 'Order Date' in df.columns:
-            df = df.rename(columns={'Order Date': 'OrderDate'})
-        
-        # Verify required columns
-        required_columns = ['CustomerID', 'OrderDate', 'Sales']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            logger.error(f"Missing required columns in sales data: {missing_columns}")
-            raise ValueError(f"Missing required columns: {missing_columns}")
-        
-        # Convert OrderDate to datetime
-        df['OrderDate'] = pd.to_datetime(df['OrderDate'], errors='coerce')
+        fingerprint = file_fingerprint(file_path) if use_cache else None
+        df = normalize_sales_frame(pd.read_csv(file_path))
         logger.info(f"Loaded {len(df)} rows of sales data")
+
+        # Snapshot the parsed frame so later loads skip CSV parsing
+        if use_cache:
+            write_snapshot(file_path, df, fingerprint=fingerprint)
+        if compact:
+            log_memory_usage(df, "sales frame")
+            df = apply_compact_schema(df)
+            log_memory_usage(df, "compact sales frame")
         return df
     except Exception as e:
         logger.error(f"Failed to load sales data: {str(e)}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
+
+def iter_sales_chunks(file_path: str = None, chunksize: int = None, usecols=None):
+    """
+    Stream the sales file in bounded chunks of at most `chunksize` rows, each
+    normalized the same way as load_sales_data. Peak memory is set by the chunk
+    size, not the file size. `usecols` takes normalized column names and must
+    include CustomerID, OrderDate and Sales.
+    """
+    file_path = file_path or SALES_DATA_PATH
+    chunksize = chunksize or DEFAULT_CHUNK_SIZE
+    logger.info(f"Streaming sales data from {file_path} in chunks of {chunksize} rows")
+    rows = 0
+    try:
+        reader = pd.read_csv(
+            file_path,
+            chunksize=chunksize,
+            usecols=(lambda col: COLUMN_ALIASES.get(col, col) in usecols) if usecols else None
+        )
+        for chunk in reader:
+            rows += len(chunk)
+            yield normalize_sales_frame(chunk)
+        logger.info(f"Streamed {rows} rows of sales data")
+    except Exception as e:
+        logger.error(f"Failed to stream sales data: {str(e)}", exc_info=True)
+        raise
@@ -0,0 +1,101 @@
+import os
+import asyncio
+import logging
+import threading
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, Any
+from config import load_config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# One process pool shared by the engines' parallel sections (cash flow batch,
+# k sweep, price grid). Workers are spawned, not forked: the API process holds
+# a MongoClient and I/O threads that a forked child must not inherit.
+_pool: Optional[ProcessPoolExecutor] = None
+# Threads that synchronous API requests run whole tasks (pandas/sklearn) on,
+# apart from database.py's I/O pool so long tasks cannot starve quick reads
+_task_executor: Optional[ThreadPoolExecutor] = None
+DEFAULT_TASK_THREADS = 4
+_lock = threading.Lock()
+
+def worker_pool_size() -> int:
+    return int(load_config().get("worker_processes") or os.cpu_count() or 1)
+
+def get_worker_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                workers = worker_pool_size()
+                _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+                logger.info(f"Started engine worker pool with {workers} processes")
+    return _pool
+
+def _discard_pool(broken: ProcessPoolExecutor) -> None:
+    global _pool
+    with _lock:
+        if _pool is not broken:
+            return
+        _pool = None
+    logger.warning("Engine worker pool is broken, starting a new one")
+    broken.shutdown(wait=False, cancel_futures=True)
+
+def shutdown_worker_pool() -> None:
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def submit_all(fn: Callable, arguments: List[tuple], max_workers: int = None) -> List[Future]:
+    """
+    Submit fn(*args) for every argument tuple to the shared pool, keeping at
+    most max_workers of them in flight (the pool size when not given).
+    Futures come back in argument order.
+    """
+    pool = get_worker_pool()
+    slots = threading.BoundedSemaphore(max(1, min(max_workers or worker_pool_size(), worker_pool_size())))
+    futures = []
+    for args in arguments:
+        slots.acquire()
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            pool = get_worker_pool()
+            future = pool.submit(fn, *args)
+        future.add_done_callback(lambda _: slots.release())
+        futures.append(future)
+    return futures
+
+def map_all(fn: Callable, arguments: List[tuple], max_workers: int = None) -> list:
+    """Results of fn(*args) per argument tuple, in order; the first failure is raised."""
+    return [future.result() for future in submit_all(fn, arguments, max_workers)]
+
+def get_task_executor() -> ThreadPoolExecutor:
+    """The shared task thread pool, sized by task_threads."""
+    global _task_executor
+    if _task_executor is None:
+        with _lock:
+            if _task_executor is None:
+                workers = int(load_config().get("task_threads") or DEFAULT_TASK_THREADS)
+                _task_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agentbi-task")
+                logger.info(f"Started task thread pool with {workers} workers")
+    return _task_executor
+
+async def run_compute(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a whole task on the task pool without stalling the event loop or the I/O pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_task_executor(), partial(fn, *args, **kwargs))
+
+def shutdown_task_executor() -> None:
+    """Wait for running tasks and stop the task pool; the next run_compute() restarts it."""
+    global _task_executor
+    with _lock:
+        executor, _task_executor = _task_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
@@ -0,0 +1,83 @@
+import os
+import tempfile
+from pathlib import Path
+os.environ.setdefault("AGENTBI_CACHE_DIR", tempfile.mkdtemp(prefix="agentbi-cache-"))
+
+import numpy as np
+import pandas as pd
+import pytest
+from services.cluster_engine import run_clustering, stream_customer_aggregates
+from services.rfm_features import build_rfm_features, rfm_from_aggregates
+from services.utils import normalize_sales_frame, to_day_numbers
+
+def _sales_frame(n_rows: int = 5000, n_customers: int = 800, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "CustomerID": [f"C-{i:05d}" for i in rng.integers(0, n_customers, n_rows)],
+        "OrderDate": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 700, n_rows), unit="D"),
+        "Sales": rng.lognormal(5, 1.2, n_rows).round(2)
+    })
+
+def _density_total(result) -> int:
+    return sum(cell[2] for cells in result["graph_density"]["cells"].values() for cell in cells)
+
+def test_density_grid_many_clusters():
+    """k >= 5 at the default 32 bins packs cell keys past the int8 range."""
+    df = _sales_frame()
+    result = run_clustering(sales_data=df, n_clusters=5, graph_mode="density", warm_start=False, use_cache=False)
+    assert result["status"] == "success", result["message"]
+    assert len(result["graph_density"]["cells"]) == 5
+    assert _density_total(result) == df["CustomerID"].nunique()
+
+def test_density_grid_64_bins():
+    df = _sales_frame()
+    result = run_clustering(sales_data=df, n_clusters=3, graph_mode="density", density_bins=64, warm_start=False, use_cache=False)
+    assert result["status"] == "success", result["message"]
+    assert len(result["graph_density"]["recency_edges"]) == 65
+    assert _density_total(result) == df["CustomerID"].nunique()
+
+def test_streamed_aggregates_match_in_memory_rfm(tmp_path):
+    """
+    Merging per-chunk partial aggregates must give the in-memory RFM features,
+    for customers spread over many chunks and rows with missing sales or dates.
+    """
+    df = _sales_frame(n_rows=2000, n_customers=150, seed=1)
+    df.loc[df.index % 17 == 0, "Sales"] = np.nan
+    df.loc[df.index % 29 == 0, "OrderDate"] = pd.NaT
+    df.loc[df["CustomerID"] == df["CustomerID"].iloc[0], "Sales"] = np.nan
+    file_path = tmp_path / "sales.csv"
+    df.to_csv(file_path, index=False)
+
+    totals = stream_customer_aggregates(str(file_path), chunksize=37)
+    streamed = rfm_from_aggregates(
+        totals["CustomerID"], to_day_numbers(totals["last_order"]), totals["monetary"], totals["frequency"], "2026-01-01"
+    )
+    in_memory = build_rfm_features(normalize_sales_frame(pd.read_csv(file_path)), "2026-01-01")
+    assert len(streamed) == df["CustomerID"].nunique()
+    pd.testing.assert_frame_equal(streamed, in_memory, check_exact=False, rtol=1e-9)
+
+def test_warm_start_keeps_engine_mode_and_refits_changed_customers():
+    """A stored full-KMeans model must not stand in for a minibatch request."""
+    mongomock = pytest.importorskip("mongomock")
+    db = mongomock.MongoClient().db
+    df = _sales_frame()
+    run = lambda data, mode: run_clustering(
+        sales_data=data, n_clusters=3, engine_mode=mode, use_cache=False, persist_assignments=False, db=db
+    )
+    assert not run(df, "full")["model"]["warm_started"]
+    minibatch = run(df, "minibatch")
+    assert minibatch["engine_mode"] == "minibatch" and not minibatch["model"]["warm_started"]
+
+    unchanged = run(df, "minibatch")["model"]
+    assert unchanged["warm_started"] and unchanged["iterations"] == 0 and unchanged["reassigned_customers"] == 0
+
+    new_orders = _sales_frame(n_rows=40, n_customers=20, seed=5)
+    refit = run(pd.concat([df, new_orders], ignore_index=True), "minibatch")["model"]
+    assert refit["warm_started"] and refit["iterations"] > 0
+    assert refit["reassigned_customers"] == new_orders["CustomerID"].nunique()
+
+if __name__ == "__main__":
+    test_density_grid_many_clusters()
+    test_density_grid_64_bins()
+    test_streamed_aggregates_match_in_memory_rfm(Path(tempfile.mkdtemp()))
+    test_warm_start_keeps_engine_mode_and_refits_changed_customers()
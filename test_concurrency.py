@@ -0,0 +1,62 @@
+import time
+import asyncio
+import httpx
+from main import app
+from database import get_db
+
+QUERY_DELAY = 0.5
+CONCURRENT_REQUESTS = 8
+
+class SlowCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+class SlowCollection:
+    """Collection whose reads block like a slow Mongo query."""
+    def find(self, query=None, *args, **kwargs):
+        time.sleep(QUERY_DELAY)
+        return SlowCursor([{"id": "n1", "read": False}])
+
+    def find_one(self, query=None, *args, **kwargs):
+        time.sleep(QUERY_DELAY)
+        return {"timestamp": "2025-01-01_00:00"}
+
+class SlowDB:
+    def __getattr__(self, name):
+        return SlowCollection()
+
+    def __getitem__(self, name):
+        return SlowCollection()
+
+async def _timed_requests(paths):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(client.get(path) for path in paths))
+        return time.perf_counter() - start, responses
+
+def test_requests_do_not_serialize():
+    """
+    Concurrent requests whose queries each block for QUERY_DELAY should take
+    about one QUERY_DELAY in total, not CONCURRENT_REQUESTS of them.
+    """
+    app.dependency_overrides[get_db] = lambda: SlowDB()
+    try:
+        paths = ["/api/notifications", "/api/latest-pipeline", "/api/task-results/3"] * CONCURRENT_REQUESTS
+        paths = paths[:CONCURRENT_REQUESTS]
+        elapsed, responses = asyncio.run(_timed_requests(paths))
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+    assert all(response.status_code == 200 for response in responses), [response.text for response in responses]
+    serialized = QUERY_DELAY * CONCURRENT_REQUESTS
+    print(f"{CONCURRENT_REQUESTS} concurrent requests took {elapsed:.2f}s (serialized: {serialized:.2f}s)")
+    assert elapsed < serialized / 2
+
+if __name__ == "__main__":
+    test_requests_do_not_serialize()
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+from services.elasticity_engine import estimate_elasticities, grid_search_prices
+
+MULTIPLIERS = np.linspace(0.8, 1.2, 9)
+
+def _order_lines(product: str, category: str, sub_category, segment: str, elasticity: float, n: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    price = rng.uniform(8, 12, n)
+    quantity = np.maximum(1, np.round(200 * price ** elasticity))
+    return pd.DataFrame({
+        "Product ID": product,
+        "Category": category,
+        "Sub-Category": sub_category,
+        "Segment": segment,
+        "Sales": price * quantity,
+        "Quantity": quantity,
+        "Profit": (price - 6) * quantity
+    })
+
+def test_product_without_estimate_keeps_its_price():
+    """A product left out of the estimates must not borrow another product's elasticity or Category."""
+    df = pd.concat([
+        _order_lines("P1", "A", "A1", "Consumer", -2.5, 40, seed=1),
+        _order_lines("P2", "B", "B1", "Corporate", -1.5, 40, seed=2),
+        _order_lines("P3", "A", None, "Consumer", -3.0, 40, seed=3)
+    ], ignore_index=True)
+    estimates = estimate_elasticities(df)
+    assert "P3" not in set(estimates["Product ID"])
+
+    recommendations, segment_optima = grid_search_prices(df, estimates, MULTIPLIERS, max_workers=2)
+    _, expected_optima = grid_search_prices(df[df["Product ID"] != "P3"], estimates, MULTIPLIERS, max_workers=2)
+    assert set(recommendations["Product ID"]) == {"P1", "P2"}
+    assert segment_optima == expected_optima
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
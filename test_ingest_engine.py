@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+from services.ingest_engine import ingest_incremental, _daily_rollup, ROLLUP_COLLECTION
+from services.utils import normalize_sales_frame
+
+mongomock = pytest.importorskip("mongomock")
+
+def _sales_rows(n_rows: int, start_row_id: int, seed: int, with_row_id: bool = True) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "Row ID": np.arange(start_row_id, start_row_id + n_rows),
+        "Order Date": (pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, n_rows), unit="D")).strftime("%m/%d/%Y"),
+        "Customer ID": [f"C-{i:04d}" for i in rng.integers(0, 500, n_rows)],
+        "Sales": rng.uniform(1, 1000, n_rows).round(2),
+        "Quantity": rng.integers(1, 10, n_rows),
+        "Profit": rng.uniform(-50, 200, n_rows).round(4)
+    })
+    return df if with_row_id else df.drop(columns=["Row ID"])
+
+def _stored_rollups(db) -> pd.DataFrame:
+    docs = list(db[ROLLUP_COLLECTION].find({}, {"_id": 0, "pipeline_id": 0}))
+    return pd.DataFrame(docs).set_index("date").sort_index()[["sales", "orders", "profit", "quantity"]]
+
+def _recomputed_rollups(file_path) -> pd.DataFrame:
+    expected = _daily_rollup(normalize_sales_frame(pd.read_csv(file_path)))
+    expected.index = expected.index.rename("date")
+    return expected.astype(np.float64)
+
+@pytest.mark.parametrize("with_row_id", [True, False])
+def test_incremental_append_matches_full_recompute(tmp_path, with_row_id):
+    """
+    Appended rows dated inside the already ingested range, or carrying lower
+    Row IDs than earlier rows, must still be folded in.
+    """
+    file_path = tmp_path / "sales.csv"
+    _sales_rows(5000, 10_000, seed=1, with_row_id=with_row_id).to_csv(file_path, index=False)
+    db = mongomock.MongoClient().db
+    first = ingest_incremental(db, file_path=str(file_path), chunksize=1000)
+    assert first["status"] == "success" and first["mode"] == "rebuild"
+
+    # Late rows: same date range, lower Row IDs
+    _sales_rows(5000, 1, seed=2, with_row_id=with_row_id).to_csv(file_path, mode="a", header=False, index=False)
+    second = ingest_incremental(db, file_path=str(file_path))
+    assert second["mode"] == "incremental"
+    assert second["rows_ingested"] == 5000
+
+    stored = _stored_rollups(db)
+    expected = _recomputed_rollups(file_path)
+    pd.testing.assert_frame_equal(stored, expected, check_names=False, check_freq=False, rtol=1e-9)
+
+def test_rebuild_leaves_partial_last_row_for_next_run(tmp_path):
+    """A half-written last row is skipped by the rebuild and folded in once when completed."""
+    file_path = tmp_path / "sales.csv"
+    _sales_rows(5000, 1, seed=3).to_csv(file_path, index=False)
+    last_row = _sales_rows(1, 5001, seed=4).to_csv(header=False, index=False)
+    with open(file_path, "a") as f:
+        f.write(last_row[:len(last_row) // 2])
+    db = mongomock.MongoClient().db
+    first = ingest_incremental(db, file_path=str(file_path), chunksize=1000)
+    assert first["mode"] == "rebuild" and first["rows_ingested"] == 5000
+
+    with open(file_path, "a") as f:
+        f.write(last_row[len(last_row) // 2:])
+    second = ingest_incremental(db, file_path=str(file_path))
+    assert second["mode"] == "incremental" and second["rows_ingested"] == 1
+
+    pd.testing.assert_frame_equal(_stored_rollups(db), _recomputed_rollups(file_path), check_names=False, check_freq=False, rtol=1e-9)
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
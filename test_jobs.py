@@ -0,0 +1,37 @@
+import os
+import pytest
+import jobs
+import run_agent
+from concurrent.futures.process import BrokenProcessPool
+
+mongomock = pytest.importorskip("mongomock")
+
+@pytest.fixture
+def db(monkeypatch):
+    db = mongomock.MongoClient().db
+    monkeypatch.setattr(jobs, "get_db", lambda: db)
+    yield db
+    jobs.shutdown_job_pool()
+
+def test_cancel_while_running_is_recorded(db, monkeypatch):
+    """A cancel requested while the task runs must not end as succeeded with a result."""
+    def execute_task(task_id, params, db):
+        jobs.cancel_job(db, "j1")
+        return {"status": "success", "result": {"status": "success"}}
+    monkeypatch.setattr(run_agent, "execute_task", execute_task)
+    db[jobs.JOB_COLLECTION].insert_one({"job_id": "j1", "status": "running"})
+    assert jobs._run_job("j1", 3, {}) == "cancelled"
+    job = jobs.get_job(db, "j1")
+    assert job["status"] == "cancelled"
+    assert "result" not in job
+
+def test_submit_after_worker_crash_rebuilds_pool(db):
+    pool = jobs.get_job_pool()
+    with pytest.raises(BrokenProcessPool):
+        pool.submit(os._exit, 1).result(timeout=60)
+    job = jobs.submit_job(db, 7, {})
+    assert jobs.get_job_pool() is not pool
+    assert jobs.get_job(db, job["job_id"])["status"] in ("queued", "running", "failed", "succeeded")
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
@@ -0,0 +1,33 @@
+import os
+import time
+import pytest
+from services import model_cache
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_cache, "MODEL_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(model_cache, "MODEL_CACHE_CAPACITY", 3)
+    monkeypatch.setattr(model_cache, "_entries", model_cache.OrderedDict())
+    return tmp_path
+
+def _stored_keys(directory) -> set:
+    return {name[:-len(".pkl")] for name in os.listdir(directory) if name.endswith(".pkl")}
+
+def test_disk_store_is_bounded_and_keeps_recently_used(cache):
+    for key in ["a", "b", "c"]:
+        model_cache.put_cached(key, {"key": key})
+        time.sleep(0.02)
+    assert model_cache.get_cached("a") == {"key": "a"}
+    time.sleep(0.02)
+    model_cache.put_cached("d", {"key": "d"})
+    time.sleep(0.02)
+    model_cache.put_cached("e", {"key": "e"})
+
+    assert _stored_keys(cache) == {"a", "d", "e"}
+    # A fresh process only sees the disk store
+    model_cache._entries.clear()
+    assert model_cache.get_cached("b") is None
+    assert model_cache.get_cached("a") == {"key": "a"}
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+from services import snapshot_cache
+from services.snapshot_cache import load_snapshot, write_snapshot
+
+def _mapped_base(values: np.ndarray):
+    while values is not None and not isinstance(values, np.memmap):
+        values = values.base
+    return values
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    file_path = tmp_path / "sales.csv"
+    df = pd.DataFrame({
+        "Row ID": np.arange(1, 1001),
+        "OrderDate": pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(1000) % 365, unit="D"),
+        "CustomerID": [f"C-{i % 97:03d}" for i in range(1000)],
+        "Sales": np.linspace(1, 500, 1000).round(2),
+        "Profit": np.linspace(-20, 80, 1000).round(4)
+    })
+    df.to_csv(file_path, index=False)
+    write_snapshot(str(file_path), df)
+    return str(file_path), df
+
+def test_loaded_columns_stay_memory_mapped(source):
+    file_path, df = source
+    loaded = load_snapshot(file_path, as_category=True)
+    pd.testing.assert_frame_equal(loaded.astype({"CustomerID": object}), df)
+    for name in ["Row ID", "Sales", "Profit"]:
+        assert isinstance(_mapped_base(loaded[name].to_numpy()), np.memmap), name
+    assert isinstance(_mapped_base(loaded["OrderDate"].array._ndarray), np.memmap)
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])